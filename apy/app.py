@@ -1,16 +1,58 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import List, Optional, Dict
+from fastapi import FastAPI, HTTPException, Header, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional, Dict, Iterator
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
 import uvicorn
+import asyncio
 import json
-from db import PseudoDB
-from llm import openai_client_tool_completion_request
-from utils import filter_data_tool
-from schemas import Feedback, TaggedClusters, FilterParams
-db = PseudoDB()
+import logging
+import os
+import re
+import time
+from db import PseudoDB, paginate, shared_store
+from llm import AsyncTTLCache, embed_texts, llm_metrics, openai_client_tool_completion_request
+from llm.embeddings import EMBEDDING_MODEL
+from utils import get_filter_tool
+from schemas import Feedback, Tag, TaggedClusters, TagsResponse, FacetsResponse, TrendsResponse, FilterParams
+from instrumentation import TimingMiddleware, profiler, registry, timed
+shared_store.get()
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
+
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+DATA_WATCH_INTERVAL = float(os.getenv('DATA_WATCH_INTERVAL', '0'))
+PROFILE_SLOW_REQUESTS_MS = float(os.getenv('PROFILE_SLOW_REQUESTS_MS', '0'))
+
+# filtering and model building are CPU-bound; a bounded pool keeps them off the event loop
+filter_executor = ThreadPoolExecutor(max_workers=int(os.getenv('FILTER_THREADS', '4')), thread_name_prefix='filter')
+
+STREAM_BATCH_SIZE = 500
+
+LOCAL_PARSE_CONFIDENCE = 1.0
+
+ai_filter_cache = AsyncTTLCache(
+    maxsize=int(os.getenv('AI_FILTER_CACHE_SIZE', '1024')),
+    ttl=float(os.getenv('AI_FILTER_CACHE_TTL', '600'))
+)
+
+query_embedding_cache = AsyncTTLCache(
+    maxsize=int(os.getenv('QUERY_EMBEDDING_CACHE_SIZE', '1024')),
+    ttl=float(os.getenv('QUERY_EMBEDDING_CACHE_TTL', '86400'))
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if DATA_WATCH_INTERVAL > 0:
+        shared_store.watch(DATA_WATCH_INTERVAL)
+    if PROFILE_SLOW_REQUESTS_MS > 0:
+        profiler.start(threshold=PROFILE_SLOW_REQUESTS_MS / 1000)
+    yield
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -19,9 +61,12 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(TimingMiddleware)
 
 class GroupsRequest(BaseModel):
     filters: Optional[FilterParams] = None
+    limit: Optional[int] = Field(default=None, gt=0)
+    cursor: Optional[str] = None
 
 class FeedbackGroup(BaseModel):
     feedback: List[Feedback]
@@ -29,11 +74,19 @@ class FeedbackGroup(BaseModel):
 class GroupsResponse(BaseModel):
     data: List[FeedbackGroup]
     tagged_clusters: TaggedClusters
+    next_cursor: Optional[str] = None
+
+class ClusterLine(BaseModel):
+    cluster: str
+    tagged_cluster: Tag
 
-class TagsResponse(BaseModel):
-    tags: List[str]
-    importance_score_range: Dict[str, float]
-    customer_impact_range: Dict[str, int]
+class FeedbackRow(BaseModel):
+    feedback: Feedback
+    cluster: Optional[str] = None
+
+class FacetsRequest(BaseModel):
+    filters: Optional[FilterParams] = None
+    date_bucket: Literal['day', 'week', 'month'] = 'day'
 
 class AIQueryRequest(BaseModel):
     query: str
@@ -41,9 +94,61 @@ class AIQueryRequest(BaseModel):
 class AIQueryResponse(BaseModel):
     filters: FilterParams
 
-@app.post("/groups", response_model=GroupsResponse)
-async def group_feedback(request: GroupsRequest):
-    print("Received request:", request)
+class SimilarRequest(BaseModel):
+    feedback_id: Optional[int] = None
+    query: Optional[str] = None
+    field: Literal['name', 'description'] = 'description'
+    k: int = Field(default=10, gt=0, le=100)
+
+class SimilarFeedback(BaseModel):
+    feedback: Feedback
+    score: float
+
+class SimilarResponse(BaseModel):
+    results: List[SimilarFeedback]
+
+class ReloadResponse(BaseModel):
+    generation: int
+    feedback_count: int
+
+class ProfilerSettings(BaseModel):
+    enabled: bool
+    threshold_ms: float = Field(default=500, ge=0)
+    interval_ms: float = Field(default=5, gt=0)
+
+def check_admin(token: Optional[str]) -> None:
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=503, detail="Admin endpoints are disabled; set ADMIN_TOKEN to enable them")
+    if token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+def get_page(db: PseudoDB, request: GroupsRequest):
+    filters = request.filters.model_dump(exclude_unset=True) if request.filters else {}
+    try:
+        return paginate(db.filter_rows(filters), request.limit, request.cursor, db.index)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def run_filter(func, *args):
+    submitted = time.perf_counter()
+
+    def call():
+        registry.observe('filter_queue_seconds', time.perf_counter() - submitted)
+        return func(*args)
+
+    return await asyncio.get_running_loop().run_in_executor(filter_executor, call)
+
+def build_groups(db: PseudoDB, request: GroupsRequest) -> GroupsResponse:
+    if request.limit is not None or request.cursor is not None:
+        rows, next_cursor = get_page(db, request)
+        feedback = db.get_feedback(rows)
+        # a page only carries the clusters its rows reference
+        return GroupsResponse(
+            data=[FeedbackGroup(feedback=feedback)],
+            tagged_clusters=db.get_clusters_for(feedback),
+            next_cursor=next_cursor
+        )
+
     if request.filters:
         filtered_feedback = db.filter_feedback(request.filters.model_dump(exclude_unset=True))
     else:
@@ -53,33 +158,92 @@ async def group_feedback(request: GroupsRequest):
 
     return GroupsResponse(data=groups, tagged_clusters=db.get_tagged_clusters())
 
+def render_groups(db: PseudoDB, request: GroupsRequest) -> Response:
+    """Filtering and serialization both run on the filter pool, timed separately"""
+    with timed('stage_seconds', endpoint='/groups', stage='filter'):
+        response = build_groups(db, request)
+    with timed('stage_seconds', endpoint='/groups', stage='serialize'):
+        body = response.model_dump_json()
+    return Response(content=body, media_type="application/json")
+
+@app.post("/groups", response_model=GroupsResponse)
+async def group_feedback(request: GroupsRequest):
+    logger.debug("Received request: %s", request)
+    return await run_filter(render_groups, shared_store.get(), request)
+
+@app.post("/groups/stream")
+async def stream_group_feedback(request: GroupsRequest):
+    """
+    NDJSON: one FeedbackRow per line carrying its cluster key, preceded by a ClusterLine the first time
+    that cluster is referenced, then {"next_cursor": ...} if the limit cut the result short.
+    Each STREAM_BATCH_SIZE slice goes out as one chunk, with its cluster keys looked up together.
+    """
+    db = shared_store.get()
+    rows, next_cursor = await run_filter(get_page, db, request)
+    clusters = db.get_tagged_clusters().root
+
+    def lines() -> Iterator[str]:
+        sent = set()
+        for start in range(0, len(rows), STREAM_BATCH_SIZE):
+            batch = rows[start:start + STREAM_BATCH_SIZE]
+            chunk = []
+            for feedback, key in zip(db.get_feedback(batch), db.get_cluster_keys(batch)):
+                if key is not None and key not in sent:
+                    sent.add(key)
+                    chunk.append(ClusterLine(cluster=key, tagged_cluster=clusters[key]).model_dump_json())
+                chunk.append(FeedbackRow(feedback=feedback, cluster=key).model_dump_json())
+            # one chunk per batch: a sync iterator costs a threadpool hop per item
+            yield "".join(line + "\n" for line in chunk)
+        if next_cursor:
+            yield json.dumps({"next_cursor": next_cursor}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
 
 @app.get("/tags", response_model=TagsResponse)
-async def get_tags_and_ranges():
-    all_tags = set()
-    importance_scores = []
-    customer_impacts = []
-    
-    for cluster in db.tagged_clusters.root.values():
-        all_tags.update(cluster.tags)
-        importance_scores.append(cluster.importance_score)
-        customer_impacts.append(cluster.customer_impact)
-
-    return TagsResponse(
-        tags=sorted(list(all_tags)),
-        importance_score_range={
-            "min": min(importance_scores),
-            "max": max(importance_scores)
-        },
-        customer_impact_range={
-            "min": min(customer_impacts),
-            "max": max(customer_impacts)
-        }
-    )
+async def get_tags_and_ranges(if_none_match: Optional[str] = Header(default=None)):
+    aggregates = shared_store.get().get_tag_aggregates()
+    headers = {"ETag": aggregates.etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, aggregates.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=aggregates.body, media_type="application/json", headers=headers)
 
-@app.post("/aifilter", response_model=AIQueryResponse)
-async def process_ai_query(request: AIQueryRequest):
-    query = request.query
+@app.post("/facets", response_model=FacetsResponse)
+async def get_facets(request: FacetsRequest, if_none_match: Optional[str] = Header(default=None)):
+    """Counts for the current filter instead of the rows themselves; same filters as /groups"""
+    filters = request.filters.model_dump(exclude_unset=True) if request.filters else {}
+    aggregates = await run_filter(shared_store.get().get_facets, filters, request.date_bucket)
+    headers = {"ETag": aggregates.etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, aggregates.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=aggregates.body, media_type="application/json", headers=headers)
+
+@app.get("/trends", response_model=TrendsResponse)
+async def get_trends(
+    dimension: Literal['cluster', 'tag', 'customer', 'importance', 'type'] = 'cluster',
+    bucket: Literal['day', 'week'] = 'day',
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    keys: Optional[List[str]] = Query(default=None),
+    limit: int = Query(default=10, gt=0, le=100),
+):
+    """Feedback counts over time per cluster/tag/customer/importance/type, sliced from the load-time rollups"""
+    try:
+        return shared_store.get().get_trends(dimension, bucket, date_from, date_to, keys, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def normalize_query(query: str) -> str:
+    """Case, whitespace and surrounding punctuation do not change what a query filters for"""
+    return re.sub(r"\s+", " ", query.casefold()).strip(" .,;:!?'\"")
+
+async def query_filters(query: str, filter_data_tool: List[Dict]) -> FilterParams:
     messages = [
         {
             "role": "system",
@@ -96,25 +260,109 @@ async def process_ai_query(request: AIQueryRequest):
         },
     ]
 
+    response = await openai_client_tool_completion_request(
+    messages, 
+    filter_data_tool,
+    tool_choice={"type": "function", "function": {"name": "filter_data"}}
+    )
+    response_message = response.choices[0].message
+    
+    if response_message.tool_calls and response_message.tool_calls[0].function.name == 'filter_data':
+        filter_params = json.loads(response_message.tool_calls[0].function.arguments)
+
+        return FilterParams(**filter_params)
+    else:
+        raise HTTPException(status_code=400, detail="Unexpected response format from AI")
+
+@app.post("/aifilter", response_model=AIQueryResponse)
+async def process_ai_query(request: AIQueryRequest):
+    # schema, its hash and the local parser are rebuilt once per data (re)load
+    filter_tool = get_filter_tool()
+
+    # queries made only of known customers, levels, types, tags and dates skip the LLM entirely
     try:
-        response = await openai_client_tool_completion_request(
-        messages, 
-        filter_data_tool,
-        tool_choice={"type": "function", "function": {"name": "filter_data"}}
-        )
-        response_message = response.choices[0].message
-        
-        if response_message.tool_calls and response_message.tool_calls[0].function.name == 'filter_data':
-            filter_params = json.loads(response_message.tool_calls[0].function.arguments)
+        local_filters, confidence = filter_tool.parser.parse(request.query)
+    except Exception:  # a parser bug should cost an LLM call, not the request
+        logger.exception("Local filter parser failed on %r", request.query)
+        local_filters, confidence = None, 0.0
+    if confidence >= LOCAL_PARSE_CONFIDENCE:
+        registry.increment('aifilter_resolved', via='local')
+        return AIQueryResponse(filters=local_filters)
+    registry.increment('aifilter_resolved', via='cache_or_llm')
 
-            formatted_filters = FilterParams(**filter_params)
-            
-            return AIQueryResponse(filters=formatted_filters)
-        else:
-            raise HTTPException(status_code=400, detail="Unexpected response format from AI")
+    # the tool schema carries the tag enum, so a new tag set never serves stale filters
+    key = (filter_tool.schema_hash, normalize_query(request.query))
+
+    try:
+        with timed('stage_seconds', endpoint='/aifilter', stage='cache_or_llm'):
+            formatted_filters = await ai_filter_cache.get_or_compute(key, lambda: query_filters(request.query, filter_tool.tools))
+        return AIQueryResponse(filters=formatted_filters.model_copy(deep=True))
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
+async def embed_query(text: str):
+    return (await embed_texts([text]))[0]
+
+@app.post("/similar", response_model=SimilarResponse)
+async def find_similar_feedback(request: SimilarRequest):
+    """Nearest feedback by embedding cosine similarity, to an existing item or to a free-text query"""
+    if (request.feedback_id is None) == (request.query is None):
+        raise HTTPException(status_code=400, detail="Pass exactly one of feedback_id or query")
+    db = shared_store.get()
+    if db.embeddings is None:
+        raise HTTPException(status_code=503, detail="No stored embeddings, run run_cluster.py first")
+
+    if request.feedback_id is not None:
+        vector = db.get_embedding(request.field, request.feedback_id)
+        if vector is None:
+            raise HTTPException(status_code=404, detail=f"No embedding for feedback {request.feedback_id}")
+    else:
+        text = " ".join(request.query.split())
+        try:
+            vector = await query_embedding_cache.get_or_compute((EMBEDDING_MODEL, text), lambda: embed_query(text))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
+
+    results = await run_filter(db.similar_feedback, vector, request.field, request.k, request.feedback_id)
+    return SimilarResponse(results=[SimilarFeedback(feedback=feedback, score=score) for feedback, score in results])
+
+@app.post("/admin/reload", response_model=ReloadResponse)
+async def reload_data(x_admin_token: Optional[str] = Header(default=None)):
+    """Rebuild the store from disk off the event loop; requests keep using the old data until the swap"""
+    check_admin(x_admin_token)
+    try:
+        state = await run_in_threadpool(shared_store.reload)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Reload failed: {str(e)}")
+    return ReloadResponse(generation=state.generation, feedback_count=len(state.db.index))
+
+@app.get("/metrics")
+async def get_metrics():
+    """Request, filter-stage and LLM latency histograms plus counters, cache and LLM usage stats"""
+    caches = {'aifilter': ai_filter_cache, 'query_embedding': query_embedding_cache}
+    return {
+        **registry.snapshot(),
+        'llm': llm_metrics.snapshot(),
+        'caches': {name: {'hits': cache.hits, 'misses': cache.misses, 'size': len(cache.entries)} for name, cache in caches.items()},
+        'data': {'generation': shared_store.state().generation},
+    }
+
+@app.post("/admin/profiler")
+async def configure_profiler(settings: ProfilerSettings, x_admin_token: Optional[str] = Header(default=None)):
+    """Start or stop stack sampling; requests slower than threshold_ms keep the samples taken while they ran"""
+    check_admin(x_admin_token)
+    if settings.enabled:
+        profiler.start(threshold=settings.threshold_ms / 1000, interval=settings.interval_ms / 1000)
+    else:
+        await run_in_threadpool(profiler.stop)
+    return {"enabled": profiler.enabled, "threshold_ms": profiler.threshold * 1000, "interval_ms": profiler.interval * 1000}
+
+@app.get("/admin/profiles")
+async def get_profiles(x_admin_token: Optional[str] = Header(default=None)):
+    """Recent slow-request profiles; each 'folded' list is flamegraph.pl / speedscope input"""
+    check_admin(x_admin_token)
+    return {"enabled": profiler.enabled, "profiles": profiler.recent_profiles()}
+
 if __name__ == "__main__":
     uvicorn.run("app:app", host="127.0.0.1", port=8000, reload=True)
\ No newline at end of file
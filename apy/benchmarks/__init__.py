@@ -0,0 +1,2 @@
+from .harness import BenchmarkResult, measure, measure_async, format_results
+from .synthetic import generate_feedback, generate_clusters, write_dataset, random_embeddings, fake_embed_batch
@@ -0,0 +1,81 @@
+import gc
+import time
+import tracemalloc
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional
+import numpy as np
+
+class BenchmarkResult(NamedTuple):
+    name: str
+    iterations: int
+    ops_per_second: float
+    p50_ms: float
+    p99_ms: float
+    peak_memory_mb: float
+
+def summarize(name: str, durations: List[float], peak_bytes: int) -> BenchmarkResult:
+    durations = np.array(durations)
+    return BenchmarkResult(
+        name=name,
+        iterations=len(durations),
+        ops_per_second=float(len(durations) / durations.sum()) if durations.sum() else float('inf'),
+        p50_ms=float(np.percentile(durations, 50) * 1000),
+        p99_ms=float(np.percentile(durations, 99) * 1000),
+        peak_memory_mb=peak_bytes / 2 ** 20,
+    )
+
+def measure(name: str, func: Callable[[], Any], iterations: int = 20, warmup: int = 2) -> BenchmarkResult:
+    """
+    Time iterations calls after warmup ones, then trace one more call for its peak Python/NumPy allocation.
+    Memory is traced separately because tracemalloc would distort the timings.
+    """
+    for _ in range(warmup):
+        func()
+    gc.collect()
+    durations = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return summarize(name, durations, peak)
+
+async def measure_async(name: str, func: Callable[[], Awaitable[Any]], iterations: int = 20, warmup: int = 2) -> BenchmarkResult:
+    for _ in range(warmup):
+        await func()
+    gc.collect()
+    durations = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await func()
+        durations.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        await func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return summarize(name, durations, peak)
+
+def format_results(results: List[BenchmarkResult], baseline: Optional[Dict[str, Dict[str, float]]] = None) -> str:
+    """Plain-text table; with a baseline, p50 relative to the baseline run (below 1.0 is faster)"""
+    header = f"{'benchmark':<52} {'iters':>6} {'ops/s':>11} {'p50 ms':>10} {'p99 ms':>10} {'peak MB':>9}"
+    if baseline is not None:
+        header += f" {'p50 vs base':>12}"
+    lines = [header, '-' * len(header)]
+    for result in results:
+        line = (f"{result.name:<52} {result.iterations:>6} {result.ops_per_second:>11.1f} "
+                f"{result.p50_ms:>10.3f} {result.p99_ms:>10.3f} {result.peak_memory_mb:>9.2f}")
+        if baseline is not None:
+            previous = baseline.get(result.name)
+            line += f" {result.p50_ms / previous['p50_ms']:>12.2f}" if previous and previous['p50_ms'] else f" {'-':>12}"
+        lines.append(line)
+    return "\n".join(lines)
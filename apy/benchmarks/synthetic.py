@@ -0,0 +1,103 @@
+import hashlib
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Sequence
+import numpy as np
+from utils import update_tagged_clusters
+
+CUSTOMERS = ["Loom", "Ramp", "Brex", "Vanta", "Notion", "Linear", "OpenAI"]
+TYPES = ["Sales", "Customer", "Research"]
+IMPORTANCE = ["High", "Medium", "Low"]
+START_DATE = datetime(2024, 1, 1, tzinfo=timezone.utc)
+DAYS = 366
+
+VERBS = ["Improve", "Add", "Fix", "Support", "Speed up", "Redesign", "Allow", "Simplify", "Automate", "Export"]
+SUBJECTS = [
+    "data ingestion", "CSV uploads", "dashboard filters", "user permissions", "API rate limits", "search results",
+    "billing reports", "SSO login", "Slack alerts", "audit logs", "bulk editing", "mobile layout", "webhooks",
+    "dark mode", "data mapping", "report scheduling", "team invites", "onboarding flow", "usage analytics", "exports",
+]
+PROBLEMS = [
+    "is too slow for large datasets", "fails intermittently", "is missing for enterprise accounts",
+    "confuses new users", "breaks after the latest release", "does not handle unicode", "times out under load",
+    "needs finer-grained controls", "should integrate with existing tools", "returns inconsistent results",
+]
+CONTEXTS = [
+    "Customers report", "Our sales team hears", "Research interviews show", "Support tickets say",
+    "Several admins mentioned", "The largest accounts expect",
+]
+TAG_WORDS = [
+    "Performance", "Bug", "Feature Request", "Integration", "Security", "Usability", "Reporting", "Billing",
+    "Onboarding", "Scalability", "Data Quality", "Mobile", "Notifications", "Permissions", "Search", "Export",
+]
+
+def generate_feedback(rows: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """Records shaped like db/data.json; the same rows and seed always give the same data"""
+    rng = np.random.default_rng(seed)
+    verbs = rng.integers(len(VERBS), size=rows)
+    subjects = rng.integers(len(SUBJECTS), size=rows)
+    problems = rng.integers(len(PROBLEMS), size=rows)
+    contexts = rng.integers(len(CONTEXTS), size=rows)
+    importance = rng.choice(len(IMPORTANCE), size=rows, p=[0.2, 0.5, 0.3])
+    types = rng.integers(len(TYPES), size=rows)
+    customers = rng.integers(len(CUSTOMERS), size=rows)
+    minutes = rng.integers(DAYS * 24 * 60, size=rows)
+
+    return [
+        {
+            "id": i + 1,
+            "name": f"{VERBS[verbs[i]]} {SUBJECTS[subjects[i]]}",
+            "description": f"{CONTEXTS[contexts[i]]} that {SUBJECTS[subjects[i]]} {PROBLEMS[problems[i]]}.",
+            "importance": IMPORTANCE[importance[i]],
+            "type": TYPES[types[i]],
+            "customer": CUSTOMERS[customers[i]],
+            "date": (START_DATE + timedelta(minutes=int(minutes[i]))).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        }
+        for i in range(rows)
+    ]
+
+def generate_clusters(records: Sequence[Dict[str, Any]], n_clusters: int, seed: int = 0) -> Dict[str, Dict[str, Any]]:
+    """Tagged clusters shaped like db/updated_tagged_clusters.json, with skewed sizes and real statistics"""
+    rng = np.random.default_rng(seed + 1)
+    weights = 1.0 / np.arange(1, n_clusters + 1)
+    labels = rng.choice(n_clusters, size=len(records), p=weights / weights.sum())
+    clusters: Dict[str, Dict[str, Any]] = {}
+    for code in range(n_clusters):
+        words = rng.choice(len(TAG_WORDS), size=2, replace=False)
+        clusters[str(code)] = {
+            "ids": [],
+            "tags": [f"{TAG_WORDS[words[0]]} {code % 50}", TAG_WORDS[words[1]], SUBJECTS[code % len(SUBJECTS)].title()],
+        }
+    for record, code in zip(records, labels):
+        clusters[str(code)]["ids"].append(str(record["id"]))
+    clusters = {key: cluster for key, cluster in clusters.items() if cluster["ids"]}
+    return update_tagged_clusters(list(records), clusters)
+
+def write_dataset(directory: str, rows: int, n_clusters: int, seed: int = 0) -> Dict[str, Dict[str, Any]]:
+    """db/data.json and db/updated_tagged_clusters.json under directory, so PseudoDB can run from it"""
+    records = generate_feedback(rows, seed)
+    clusters = generate_clusters(records, n_clusters, seed)
+    os.makedirs(os.path.join(directory, 'db'), exist_ok=True)
+    with open(os.path.join(directory, 'db', 'data.json'), 'w') as f:
+        json.dump(records, f)
+    with open(os.path.join(directory, 'db', 'updated_tagged_clusters.json'), 'w') as f:
+        json.dump(clusters, f)
+    return clusters
+
+def random_embeddings(rows: int, dim: int = 64, centers: int = 20, spread: float = 0.3, seed: int = 0) -> np.ndarray:
+    """Gaussian blobs around random unit centres, so clustering has real structure to find"""
+    rng = np.random.default_rng(seed)
+    means = rng.normal(size=(centers, dim))
+    means /= np.linalg.norm(means, axis=1, keepdims=True)
+    return means[rng.integers(centers, size=rows)] + spread * rng.normal(size=(rows, dim)) / np.sqrt(dim)
+
+def fake_embedding(text: str, dim: int) -> List[float]:
+    seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], 'little')
+    return np.random.default_rng(seed).normal(size=dim).tolist()
+
+def fake_embed_batch(dim: int = 64):
+    """Deterministic stand-in for the embeddings endpoint with the same signature llm.embed_texts expects"""
+    async def embed_batch(texts: List[str], model: str) -> List[List[float]]:
+        return [fake_embedding(text, dim) for text in texts]
+    return embed_batch
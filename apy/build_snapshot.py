@@ -0,0 +1,4 @@
+from db.snapshot import build_snapshot
+
+if __name__ == "__main__":
+    print(f"Snapshot written to {build_snapshot()}")
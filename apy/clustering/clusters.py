@@ -1,37 +1,308 @@
-from typing import Tuple
+import math
+import tempfile
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 import numpy as np
-from sklearn.cluster import AgglomerativeClustering, KMeans
+from scipy.cluster.hierarchy import cut_tree, linkage
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+from sklearn.cluster import AgglomerativeClustering, KMeans, MiniBatchKMeans
+from sklearn.decomposition import PCA
 from sklearn.metrics import silhouette_score
 from sklearn.metrics.pairwise import pairwise_distances
-from joblib import Parallel, delayed
+from sklearn.neighbors import NearestNeighbors, kneighbors_graph
+from sklearn.random_projection import GaussianRandomProjection
+from joblib import Memory, Parallel, delayed
 from tqdm import tqdm
 
-def calculate_score(n: int, vectors: np.ndarray, method: str) -> Tuple[int, float, np.ndarray]:
-    if method == 'kmeans':
-        clusterer = KMeans(n_clusters=n, random_state=12)
-    else:  # agglomerative
-        clusterer = AgglomerativeClustering(n_clusters=n)
-    
-    labels = clusterer.fit_predict(vectors)
-    
-    if len(np.unique(labels)) > 1:
-        score = silhouette_score(vectors, labels, metric='cosine')
-        return n, score, labels
+SEARCH_STRATEGIES = ('auto', 'exhaustive', 'coarse_to_fine', 'golden')
+AUTO_EXHAUSTIVE_LIMIT = 200  # 'auto' sweeps every n below this many vectors
+COARSE_POINTS = 12
+PLATEAU_TOLERANCE = 1e-3
+CUT_CHUNK = 64
+
+METHODS = ('kmeans', 'agglomerative', 'minibatch_kmeans', 'knn_agglomerative')
+REDUCTIONS = ('pca', 'random_projection')
+KNN_NEIGHBORS = 15
+MINIBATCH_SIZE = 4096
+
+# preset for hundreds of thousands of items: no O(n^2) structures anywhere
+LARGE_SCALE_OPTIONS: Dict[str, Any] = {
+    'methods': ('minibatch_kmeans', 'knn_agglomerative'),
+    'dtype': np.float32,
+    'reduce': 'pca',
+    'n_components': 64,
+    'search': 'coarse_to_fine',
+    'sample_size': 10_000,
+    'max_clusters': 500,
+}
+
+def prepare_vectors(vectors: np.ndarray, dtype: Optional[type] = None, reduce: Optional[str] = None,
+                    n_components: int = 64) -> np.ndarray:
+    """Optionally downcast (e.g. float32 halves memory) and project to n_components dimensions"""
+    if dtype is not None:
+        vectors = np.asarray(vectors, dtype=dtype)
+    if reduce is None or n_components >= vectors.shape[1]:
+        return vectors
+    if reduce == 'pca':
+        reducer = PCA(n_components=n_components, svd_solver='randomized', random_state=12)
+    elif reduce == 'random_projection':
+        reducer = GaussianRandomProjection(n_components=n_components, random_state=12)
     else:
-        return n, -1, labels
+        raise ValueError(f"Unknown reduction {reduce!r}, expected one of {REDUCTIONS}")
+    return reducer.fit_transform(vectors).astype(vectors.dtype, copy=False)
+
+def make_clusterer(method: str, n: int, connectivity=None, memory: Optional[Memory] = None):
+    if method == 'kmeans':
+        return KMeans(n_clusters=n, random_state=12)
+    if method == 'minibatch_kmeans':
+        return MiniBatchKMeans(n_clusters=n, random_state=12, batch_size=MINIBATCH_SIZE, n_init=3)
+    if method == 'knn_agglomerative':
+        # ward restricted to a k-nearest-neighbour graph: O(n * k) memory instead of O(n^2)
+        return AgglomerativeClustering(n_clusters=n, connectivity=connectivity, memory=memory, compute_full_tree=True)
+    if method == 'agglomerative':
+        return AgglomerativeClustering(n_clusters=n)
+    raise ValueError(f"Unknown clustering method {method!r}, expected one of {METHODS}")
+
+def knn_graph(vectors: np.ndarray, n_neighbors: int = KNN_NEIGHBORS, n_jobs: Optional[int] = None):
+    """Sparse symmetric kNN connectivity joined into one component; sklearn computes it in working_memory sized chunks"""
+    graph = kneighbors_graph(vectors, n_neighbors=min(n_neighbors, len(vectors) - 1), include_self=False, n_jobs=n_jobs)
+    return connect_components(graph.maximum(graph.T).tocsr(), vectors, n_jobs)
+
+def connect_components(graph, vectors: np.ndarray, n_jobs: Optional[int] = None):
+    """
+    Link every component to its nearest neighbouring component until one remains, through one representative
+    each (the member nearest the component mean). AgglomerativeClustering would otherwise fill the gaps
+    with dense distances between components, breaking the O(n * k) memory bound.
+    """
+    while True:
+        count, labels = connected_components(graph, directed=False)
+        if count == 1:
+            return graph
+        spread = np.linalg.norm(vectors - cluster_means(vectors, labels, count)[labels], axis=1)
+        order = np.lexsort((spread, labels))
+        representatives = order[np.searchsorted(labels[order], np.arange(count))]
+        nearest = NearestNeighbors(n_neighbors=1, n_jobs=n_jobs).fit(vectors[representatives]).kneighbors(return_distance=False)[:, 0]
+        links = csr_matrix((np.ones(count), (representatives, representatives[nearest])), shape=graph.shape)
+        # each pass at least halves the component count
+        graph = graph.maximum(links).maximum(links.T).tocsr()
+
+def score_labels(vectors: np.ndarray, labels: np.ndarray, sample_size: Optional[int] = None, random_state: int = 12,
+                 distances: Optional[np.ndarray] = None) -> float:
+    """Cosine silhouette; a precomputed cosine distance matrix gives the same score without recomputing distances"""
+    if len(np.unique(labels)) < 2:
+        return -1
+    X, metric = (vectors, 'cosine') if distances is None else (distances, 'precomputed')
+    if sample_size is None or sample_size >= len(vectors):
+        return silhouette_score(X, labels, metric=metric)
+    try:
+        return silhouette_score(X, labels, metric=metric, sample_size=sample_size, random_state=random_state)
+    except ValueError:  # the sample landed in a single cluster
+        return -1
+
+def calculate_score(n: int, vectors: np.ndarray, method: str, sample_size: Optional[int] = None,
+                    connectivity=None, memory: Optional[Memory] = None,
+                    distances: Optional[np.ndarray] = None) -> Tuple[int, float, np.ndarray]:
+    labels = make_clusterer(method, n, connectivity, memory).fit_predict(vectors)
+    return n, score_labels(vectors, labels, sample_size, distances=distances), labels
+
+def score_cut(n: int, vectors: np.ndarray, labels: np.ndarray, sample_size: Optional[int] = None,
+              distances: Optional[np.ndarray] = None) -> Tuple[int, float, np.ndarray]:
+    return n, score_labels(vectors, labels, sample_size, distances=distances), labels
+
+class ClusterCountSearch:
+    """
+    Memoised silhouette scores per cluster count. Agglomerative cuts one ward tree instead of refitting;
+    knn_agglomerative caches its connectivity-constrained tree on disk so each n is only a cut.
+    tasks/add split evaluate so a scheduler can run the fits of several searches in one pool.
+    """
+
+    def __init__(self, vectors: np.ndarray, method: str, sample_size: Optional[int] = None,
+                 distances: Optional[np.ndarray] = None, n_jobs: int = -1):
+        self.vectors = vectors
+        self.method = method
+        self.sample_size = sample_size
+        self.distances = distances
+        self.n_jobs = n_jobs
+        # labels may be None for counts restored from a checkpoint; best() always has them
+        self.results: Dict[int, Tuple[float, Optional[np.ndarray]]] = {}
+        # same ward/euclidean merge tree AgglomerativeClustering builds
+        self.tree = linkage(vectors, method='ward') if method == 'agglomerative' else None
+        self.connectivity = self.memory = None
+        if method == 'knn_agglomerative':
+            self.connectivity = knn_graph(vectors, n_jobs=n_jobs)
+            self._cache_dir = tempfile.TemporaryDirectory()
+            self.memory = Memory(self._cache_dir.name, verbose=0)
+            # build the tree once up front so parallel workers only read it from the cache
+            self.evaluate([2])
+
+    def pending(self, ns: Iterable[int]) -> List[int]:
+        return sorted(set(ns) - set(self.results))
+
+    def tasks(self, ns: Sequence[int]) -> list:
+        """Delayed fit-and-score calls for ns; ward trees are cut here so workers only score"""
+        if self.tree is not None:
+            cuts = cut_tree(self.tree, n_clusters=ns)
+            return [delayed(score_cut)(n, self.vectors, cuts[:, i], self.sample_size, self.distances) for i, n in enumerate(ns)]
+        return [
+            delayed(calculate_score)(n, self.vectors, self.method, self.sample_size, self.connectivity, self.memory, self.distances)
+            for n in ns
+        ]
+
+    def add(self, results: Iterable[Tuple[int, float, np.ndarray]]) -> None:
+        for n, score, labels in results:
+            self.results[n] = (score, labels)
+
+    def evaluate(self, ns: Iterable[int]) -> None:
+        missing = self.pending(ns)
+        for start in range(0, len(missing), CUT_CHUNK):
+            self.add(Parallel(n_jobs=self.n_jobs)(self.tasks(missing[start:start + CUT_CHUNK])))
+
+    def score(self, n: int) -> float:
+        self.evaluate([n])
+        return self.results[n][0]
+
+    def best(self) -> Tuple[int, float, np.ndarray]:
+        n = max(self.results, key=lambda n: self.results[n][0])
+        return n, *self.results[n]
+
+class Plateau:
+    """Newly scored counts in a row that failed to improve the best score; patience=None never stops"""
+
+    def __init__(self, patience: Optional[int] = None):
+        self.patience = patience
+        self.best = -math.inf
+        self.stale = 0
+        self.seen = set()
+
+    def update(self, search: ClusterCountSearch, ns: Iterable[int]) -> None:
+        for n in ns:
+            if n in self.seen:
+                continue
+            self.seen.add(n)
+            if search.score(n) > self.best + PLATEAU_TOLERANCE:
+                self.best, self.stale = search.score(n), 0
+            else:
+                self.stale += 1
+
+    @property
+    def reached(self) -> bool:
+        return self.patience is not None and self.stale >= self.patience
 
-def cluster_vectors(vectors: np.ndarray, method: str = 'kmeans', n_clusters: int = None) -> Tuple[np.ndarray, int, np.ndarray]:
+# Search strategies are generators that yield the cluster counts they need scored next and read the
+# scores back from the ClusterCountSearch, so one driver can interleave several searches in one pool.
+# With patience they stop once that many newly scored counts in a row fail to improve the best score;
+# the refining strategies only start counting after their first grid, which brackets the peak.
+
+def search_exhaustive(search: ClusterCountSearch, lo: int, hi: int, patience: Optional[int] = None) -> Iterator[List[int]]:
+    """Every n in [lo, hi]"""
+    ns = list(range(lo, hi + 1))
+    plateau = Plateau(patience)
+    for start in tqdm(range(0, len(ns), CUT_CHUNK), desc=f"Calculating silhouette scores for {search.method}"):
+        chunk = ns[start:start + CUT_CHUNK]
+        yield chunk
+        plateau.update(search, chunk)
+        if plateau.reached:
+            return
+
+def search_coarse_to_fine(search: ClusterCountSearch, lo: int, hi: int, points: int = COARSE_POINTS,
+                          patience: Optional[int] = None) -> Iterator[List[int]]:
+    """Score an evenly spaced grid, then repeatedly narrow to the neighbourhood of the best grid point"""
+    plateau = Plateau(patience)
+    while True:
+        step = max(1, math.ceil((hi - lo) / points))
+        grid = sorted(set(range(lo, hi + 1, step)) | {hi})
+        yield grid
+        best = max(grid, key=search.score)
+        first = not plateau.seen
+        plateau.update(search, grid)
+        if first:
+            plateau.stale = 0
+        if step == 1 or plateau.reached:
+            return
+        lo, hi = max(lo, best - step + 1), min(hi, best + step - 1)
+
+def search_golden(search: ClusterCountSearch, lo: int, hi: int, points: int = COARSE_POINTS,
+                  patience: Optional[int] = None) -> Iterator[List[int]]:
+    """
+    Bracket the best n with one coarse grid pass (silhouette curves are bumpy far from the peak),
+    then golden-section search inside the bracket assuming it is unimodal there
+    """
+    step = max(1, math.ceil((hi - lo) / points))
+    grid = sorted(set(range(lo, hi + 1, step)) | {hi})
+    yield grid
+    best = max(grid, key=search.score)
+    plateau = Plateau(patience)
+    plateau.update(search, grid)
+    plateau.stale = 0
+
+    inv_phi = (math.sqrt(5) - 1) / 2
+    a, b = max(lo, best - step), min(hi, best + step)
+    while b - a > 3:
+        c = b - round(inv_phi * (b - a))
+        d = a + round(inv_phi * (b - a))
+        if c >= d:
+            d = c + 1
+        yield [c, d]
+        plateau.update(search, [c, d])
+        if plateau.reached:
+            return
+        if search.score(c) >= search.score(d):
+            b = d
+        else:
+            a = c
+    yield list(range(a, b + 1))
+
+def start_search(vectors: np.ndarray, method: str, search: str = 'auto', sample_size: Optional[int] = None,
+                 patience: Optional[int] = None, max_clusters: Optional[int] = None, n_clusters: Optional[int] = None,
+                 distances: Optional[np.ndarray] = None, n_jobs: int = -1) -> Tuple[ClusterCountSearch, Iterator[List[int]]]:
+    """The memoised scores for method plus the strategy generator driving them; n_clusters pins a single count"""
+    if search not in SEARCH_STRATEGIES:
+        raise ValueError(f"Unknown search strategy {search!r}, expected one of {SEARCH_STRATEGIES}")
+    if search == 'auto':
+        search = 'exhaustive' if len(vectors) < AUTO_EXHAUSTIVE_LIMIT else 'coarse_to_fine'
+
+    counts = ClusterCountSearch(vectors, method, sample_size, distances, n_jobs)
+    if n_clusters is not None:
+        return counts, iter([[n_clusters]])
+    # same candidate range as the original sweep: 2 .. len(vectors) - 2
+    lo, hi = 2, len(vectors) - 2 if max_clusters is None else max(2, min(max_clusters, len(vectors) - 2))
+    if search == 'exhaustive':
+        return counts, search_exhaustive(counts, lo, hi, patience)
+    if search == 'coarse_to_fine':
+        return counts, search_coarse_to_fine(counts, lo, hi, patience=patience)
+    return counts, search_golden(counts, lo, hi, patience=patience)
+
+def find_best_n(vectors: np.ndarray, method: str, search: str = 'auto', sample_size: Optional[int] = None,
+                patience: Optional[int] = None, max_clusters: Optional[int] = None, n_jobs: int = -1) -> Tuple[int, float, np.ndarray]:
+    counts, requests = start_search(vectors, method, search, sample_size, patience, max_clusters, n_jobs=n_jobs)
+    for ns in requests:
+        counts.evaluate(ns)
+    return counts.best()
+
+def cluster_means(vectors: np.ndarray, labels: np.ndarray, n_clusters: int) -> np.ndarray:
+    sums = np.zeros((n_clusters, vectors.shape[1]), dtype=np.float64)
+    np.add.at(sums, labels, vectors)
+    counts = np.bincount(labels, minlength=n_clusters)[:, None]
+    return sums / np.maximum(counts, 1)
+
+def cluster_vectors(vectors: np.ndarray, method: str = 'kmeans', n_clusters: int = None, search: str = 'auto',
+                    sample_size: Optional[int] = None, patience: Optional[int] = None,
+                    max_clusters: Optional[int] = None, n_jobs: int = -1) -> Tuple[np.ndarray, int, np.ndarray]:
+    """
+    With n_clusters=None the cluster count is chosen by silhouette score using the `search` strategy
+    ('exhaustive', 'coarse_to_fine', 'golden', or 'auto') over 2..max_clusters. sample_size scores on
+    a random subset, patience stops any search once the score plateaus. n_jobs bounds the fitting workers.
+    """
     best_score = -1
     best_labels = None
 
     if n_clusters is None:
-        min_clusters = 2
-        max_clusters = len(vectors) - 1
-        
-        results = Parallel(n_jobs=-1)(delayed(calculate_score)(n, vectors, method) 
-                                      for n in tqdm(range(min_clusters, max_clusters), desc=f"Calculating silhouette scores for {method}"))
-        best_n, best_score, best_labels = max(results, key=lambda x: x[1])
-        
+        if len(vectors) < 4:
+            print(f"No valid clustering found for {method}")
+            return None, 0, None
+
+        best_n, best_score, best_labels = find_best_n(vectors, method, search, sample_size, patience, max_clusters, n_jobs)
+
         if best_score > -1:
             print(f"Optimal number of clusters for {method}: {best_n}")
             print(f"Best Silhouette Score: {best_score}")
@@ -41,45 +312,45 @@ def cluster_vectors(vectors: np.ndarray, method: str = 'kmeans', n_clusters: int
         
         optimal_clusters = best_n
     else:
-        if method == 'kmeans':
-            clusterer = KMeans(n_clusters=n_clusters, random_state=12)
-        else:  # agglomerative
-            clusterer = AgglomerativeClustering(n_clusters=n_clusters)
+        connectivity = knn_graph(vectors, n_jobs=n_jobs) if method == 'knn_agglomerative' else None
+        clusterer = make_clusterer(method, n_clusters, connectivity)
         
         best_labels = clusterer.fit_predict(vectors)
         optimal_clusters = n_clusters
 
     if optimal_clusters > 1:
-        cluster_centers = np.array([vectors[best_labels == i].mean(axis=0) for i in range(optimal_clusters)])
+        cluster_centers = cluster_means(vectors, best_labels, optimal_clusters)
         cluster_proximities = pairwise_distances(cluster_centers, metric='cosine')
     else:
         cluster_proximities = np.array([[0]])
 
     return best_labels, optimal_clusters, cluster_proximities
 
-def perform_clustering(name_embeddings: np.ndarray, desc_embeddings: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
-    methods = ['kmeans', 'agglomerative']
-    
-    name_results = [cluster_vectors(name_embeddings, method) for method in methods]
-    desc_results = [cluster_vectors(desc_embeddings, method) for method in methods]
-    
-    def get_best_result(embeddings, results):
-        best_score = -1
-        best_result = None
-        best_method = None
-        for i, result in enumerate(results):
-            if result[0] is not None:
-                score = silhouette_score(embeddings, result[0], metric='cosine')
-                if score > best_score:
-                    best_score = score
-                    best_result = result
-                    best_method = methods[i]
-        return best_result, best_method
-    
-    name_best, name_best_method = get_best_result(name_embeddings, name_results)
-    desc_best, desc_best_method = get_best_result(desc_embeddings, desc_results)
-    
-    print(f"Best method for names: {name_best_method}")
-    print(f"Best method for descriptions: {desc_best_method}")
-    
-    return name_best[0], desc_best[0]
+def perform_clustering(name_embeddings: np.ndarray, desc_embeddings: np.ndarray, methods: Sequence[str] = ('kmeans', 'agglomerative'),
+                       dtype: Optional[type] = None, reduce: Optional[str] = None, n_components: int = 64,
+                       n_jobs: int = -1, checkpoint: Optional[str] = None, **search_options) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    dtype/reduce/n_components shrink the embeddings first; see LARGE_SCALE_OPTIONS for the large-scale preset.
+    All method/embedding searches share one pool of n_jobs workers (see clustering.pipeline), which also
+    resumes from checkpoint when given.
+    """
+    from .pipeline import run_searches
+
+    methods = list(methods)
+    name_embeddings = prepare_vectors(name_embeddings, dtype, reduce, n_components)
+    desc_embeddings = prepare_vectors(desc_embeddings, dtype, reduce, n_components)
+
+    results = run_searches({'name': name_embeddings, 'description': desc_embeddings}, methods, n_jobs, checkpoint, **search_options)
+
+    def get_best_result(results):
+        # the scores the searches settled on, in methods order so ties keep the earlier method
+        valid = [result for result in results if result.score > -1]
+        return max(valid, key=lambda result: result.score, default=None)
+
+    name_best = get_best_result(results['name'])
+    desc_best = get_best_result(results['description'])
+
+    print(f"Best method for names: {name_best.method if name_best else None}")
+    print(f"Best method for descriptions: {desc_best.method if desc_best else None}")
+
+    return name_best.labels if name_best else None, desc_best.labels if desc_best else None
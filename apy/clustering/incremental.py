@@ -0,0 +1,40 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from .clusters import cluster_means
+
+CENTROIDS_PATH = 'db/cluster_centroids.npz'
+
+def save_centroids(keys: Sequence[str], centroids: np.ndarray, counts: np.ndarray, path: str = CENTROIDS_PATH) -> None:
+    np.savez(path, keys=np.array(list(keys), dtype=str), centroids=centroids, counts=counts)
+
+def load_centroids(path: str = CENTROIDS_PATH) -> Optional[Tuple[List[str], np.ndarray, np.ndarray]]:
+    try:
+        with np.load(path, allow_pickle=False) as f:
+            return [str(key) for key in f['keys']], f['centroids'], f['counts']
+    except FileNotFoundError:
+        return None
+
+def centroids_from_labels(vectors: np.ndarray, labels: np.ndarray) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """Per-label mean vectors and member counts, keyed like the tagged clusters (str(label))"""
+    present = np.unique(labels)
+    codes = np.searchsorted(present, labels)
+    return [str(label) for label in present], cluster_means(vectors, codes, len(present)), np.bincount(codes)
+
+def assign_to_centroids(vectors: np.ndarray, centroids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Index of the nearest centroid by cosine similarity, and that similarity"""
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    normed = centroids / np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+    similarities = vectors @ normed.T
+    nearest = similarities.argmax(axis=1)
+    return nearest, similarities[np.arange(len(vectors)), nearest]
+
+def update_centroids(centroids: np.ndarray, counts: np.ndarray, nearest: np.ndarray, vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Fold newly assigned vectors into the running means"""
+    sums = centroids * counts[:, None]
+    np.add.at(sums, nearest, vectors)
+    counts = counts + np.bincount(nearest, minlength=len(counts))
+    return sums / np.maximum(counts, 1)[:, None], counts
+
+def clusters_to_retag(added: Dict[str, int], sizes: Dict[str, int], threshold: float) -> List[str]:
+    """Clusters whose membership grew by more than threshold (fraction of their previous size)"""
+    return [key for key, count in added.items() if count > threshold * max(sizes.get(key, 0), 1)]
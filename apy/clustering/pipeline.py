@@ -0,0 +1,179 @@
+"""
+Scheduler for the (embedding, method) cluster-count searches of one clustering run.
+
+Every search is advanced in lock-step rounds: each round gathers the fits and silhouette scores all
+unfinished searches are waiting on and runs them as a single batch in one shared joblib pool, so
+cores stay busy while any search still has work. Inputs are L2-normalised float32 matrices written
+once to a temporary directory, together with their cosine distance matrices (up to
+PRECOMPUTED_DISTANCE_LIMIT rows); workers memory-map both instead of receiving copies, and
+silhouettes read the precomputed distances. The winning score of each search is kept, so picking
+the best method never recomputes it.
+
+With a checkpoint path, scores so far plus the labels of each search's best count are saved after
+every round. A rerun on the same inputs and options replays the searches from those scores and only
+fits the counts that were never finished.
+"""
+import hashlib
+import json
+import os
+import tempfile
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+import numpy as np
+from joblib import Parallel
+from .clusters import ClusterCountSearch, start_search
+
+CHECKPOINT_PATH = 'db/clustering_checkpoint.npz'
+PRECOMPUTED_DISTANCE_LIMIT = 10_000  # an n x n float32 matrix is 400MB at this size
+DISTANCE_BLOCK = 1024
+
+Scores = Dict[int, Tuple[float, Optional[np.ndarray]]]
+
+class SearchResult(NamedTuple):
+    field: str
+    method: str
+    n_clusters: int
+    score: float
+    labels: Optional[np.ndarray]
+
+class ScheduledSearch:
+    def __init__(self, field: str, method: str, counts: ClusterCountSearch, requests: Iterator[List[int]]):
+        self.field = field
+        self.method = method
+        self.counts = counts
+        self.requests = requests
+        self.waiting: Optional[List[int]] = next(requests, None)
+
+    @property
+    def key(self) -> str:
+        return f"{self.field}.{self.method}"
+
+    @property
+    def done(self) -> bool:
+        return self.waiting is None
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """Unit float32 rows whatever the input dtype, halving the shared memmaps and their I/O against float64"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+def share_array(directory: str, name: str, array: np.ndarray) -> np.ndarray:
+    """Saved as .npy and reopened read-only; joblib then pickles the file reference rather than the data"""
+    path = os.path.join(directory, f"{name}.npy")
+    np.save(path, np.ascontiguousarray(array), allow_pickle=False)
+    return np.load(path, mmap_mode='r')
+
+def share_cosine_distances(directory: str, name: str, vectors: np.ndarray) -> np.ndarray:
+    """1 - cosine similarity of unit rows as float32, filled block by block straight into a memory-mapped file"""
+    path = os.path.join(directory, f"{name}.distances.npy")
+    distances = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=(len(vectors), len(vectors)))
+    for start in range(0, len(vectors), DISTANCE_BLOCK):
+        block = 1 - vectors[start:start + DISTANCE_BLOCK] @ vectors.T
+        # rounding leaves tiny negatives and a non-zero diagonal, both of which silhouette_score rejects
+        np.maximum(block, 0, out=block)
+        distances[start:start + DISTANCE_BLOCK] = block
+    np.fill_diagonal(distances, 0)
+    distances.flush()
+    del distances
+    return np.load(path, mmap_mode='r')
+
+def fingerprint(inputs: Dict[str, np.ndarray], methods: Sequence[str], options: Dict[str, Any]) -> str:
+    """Identifies the inputs and options a checkpoint was written for"""
+    digest = hashlib.sha256(json.dumps([sorted(inputs), list(methods), options], sort_keys=True, default=str).encode())
+    for field in sorted(inputs):
+        digest.update(memoryview(np.ascontiguousarray(inputs[field])).cast('B'))
+    return digest.hexdigest()
+
+def best_of(scores: Scores) -> Tuple[int, float, Optional[np.ndarray]]:
+    n = max(scores, key=lambda n: scores[n][0])
+    return n, *scores[n]
+
+def load_checkpoint(path: str, key: str) -> Dict[str, Tuple[bool, Scores]]:
+    """search key -> (finished, scores) from a checkpoint written for key; empty when missing or stale"""
+    try:
+        with np.load(path, allow_pickle=False) as f:
+            if str(f['fingerprint']) != key:
+                print(f"Ignoring checkpoint {path}: written for different embeddings or options")
+                return {}
+            searches = {}
+            for name in f['searches']:
+                scores: Scores = {int(n): (float(score), None) for n, score in zip(f[f'{name}.ns'], f[f'{name}.scores'])}
+                if scores:
+                    best = int(f[f'{name}.best'])
+                    scores[best] = (scores[best][0], f[f'{name}.labels'])
+                searches[str(name)] = (bool(f[f'{name}.done']), scores)
+            return searches
+    except FileNotFoundError:
+        return {}
+
+def save_checkpoint(path: str, key: str, searches: Dict[str, Tuple[bool, Scores]]) -> None:
+    arrays = {'fingerprint': np.array(key), 'searches': np.array(list(searches), dtype=str)}
+    for name, (done, scores) in searches.items():
+        arrays[f'{name}.done'] = np.array(done)
+        arrays[f'{name}.ns'] = np.array(list(scores), dtype=np.int64)
+        arrays[f'{name}.scores'] = np.array([score for score, _ in scores.values()], dtype=np.float64)
+        if scores:
+            best, _, labels = best_of(scores)
+            arrays[f'{name}.best'] = np.array(best)
+            arrays[f'{name}.labels'] = labels
+    # written aside and swapped in, so a crash mid-write leaves the previous checkpoint intact
+    with open(path + '.tmp', 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(path + '.tmp', path)
+
+def run_searches(inputs: Dict[str, np.ndarray], methods: Sequence[str], n_jobs: int = -1, checkpoint: Optional[str] = None,
+                 **search_options) -> Dict[str, List[SearchResult]]:
+    """
+    Best cluster count, score and labels of every method on every input, in methods order per input.
+    search_options are those of cluster_vectors.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        shared = {field: share_array(directory, field, normalize_rows(vectors)) for field, vectors in inputs.items()}
+        distances = {
+            field: share_cosine_distances(directory, field, vectors) if len(vectors) <= PRECOMPUTED_DISTANCE_LIMIT else None
+            for field, vectors in shared.items()
+        }
+        key = fingerprint(shared, methods, search_options)
+        state = load_checkpoint(checkpoint, key) if checkpoint else {}
+
+        searches: List[ScheduledSearch] = []
+        for field, vectors in shared.items():
+            if search_options.get('n_clusters') is None and len(vectors) < 4:
+                continue
+            for method in methods:
+                done, scores = state.get(f"{field}.{method}", (False, {}))
+                if done:
+                    continue
+                counts, requests = start_search(vectors, method, distances=distances[field], n_jobs=n_jobs, **search_options)
+                counts.results.update(scores)
+                searches.append(ScheduledSearch(field, method, counts, requests))
+
+        with Parallel(n_jobs=n_jobs) as parallel:
+            active = [search for search in searches if not search.done]
+            while active:
+                batches = [search.counts.tasks(search.counts.pending(search.waiting)) for search in active]
+                outputs = parallel(task for batch in batches for task in batch)
+                start = 0
+                for search, batch in zip(active, batches):
+                    search.counts.add(outputs[start:start + len(batch)])
+                    start += len(batch)
+                    search.waiting = next(search.requests, None)
+                active = [search for search in active if not search.done]
+                if checkpoint:
+                    state.update({search.key: (search.done, search.counts.results) for search in searches})
+                    save_checkpoint(checkpoint, key, state)
+
+    state.update({search.key: (True, search.counts.results) for search in searches})
+    results: Dict[str, List[SearchResult]] = {field: [] for field in inputs}
+    for field in inputs:
+        for method in methods:
+            _, scores = state.get(f"{field}.{method}", (True, {}))
+            if not scores:
+                print(f"No valid clustering found for {method} on {field}")
+                continue
+            n, score, labels = best_of(scores)
+            if score > -1:
+                print(f"Optimal number of clusters for {method} on {field}: {n} (silhouette {score})")
+            else:
+                print(f"No valid clustering found for {method} on {field}")
+            results[field].append(SearchResult(field, method, n, score, labels))
+    return results
@@ -1 +1,3 @@
-from .pseudo_db import PseudoDB
\ No newline at end of file
+from .pseudo_db import PseudoDB
+from .pagination import encode_cursor, decode_cursor, paginate
+from .store import DataStore, shared_store
\ No newline at end of file
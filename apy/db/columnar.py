@@ -0,0 +1,335 @@
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+from pydantic import TypeAdapter
+from instrumentation import record_stage
+from schemas import Feedback, TaggedClusters
+from .index import CATEGORICAL_FIELDS, TEXT_FIELDS, RANGE_FIELDS, day_bounds
+from .facets import FacetCounts
+from .text_search import TextIndex
+
+EPOCH = datetime(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+US_PER_DAY = 86_400_000_000
+NAIVE = np.iinfo(np.int32).min  # utc offset sentinel for timestamps without tzinfo
+SEPARATOR = b'\x00'
+SPARSE_TEXT_RATIO = 16  # probe rows one by one when fewer than 1/16 of the table survive
+
+_datetimes = TypeAdapter(List[datetime])
+
+class TextColumn:
+    """Strings packed into one separator-terminated UTF-8 buffer with row offsets"""
+
+    def __init__(self, blob: bytes, offsets: np.ndarray):
+        self.blob = blob
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, values: Sequence[str]) -> 'TextColumn':
+        encoded = [value.encode() + SEPARATOR for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        return cls(b''.join(encoded), offsets)
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row: int) -> str:
+        return bytes(self.blob[self.offsets[row]:self.offsets[row + 1] - 1]).decode()
+
+    def strings(self) -> List[str]:
+        return bytes(self.blob[:self.offsets[-1]]).decode().split(SEPARATOR.decode())[:-1]
+
+    def contains(self, needle: str) -> np.ndarray:
+        """Mask of rows containing needle, scanning the whole buffer at C speed"""
+        mask = np.zeros(len(self), dtype=bool)
+        needle = needle.encode()
+        pos = self.blob.find(needle)
+        while pos != -1:
+            row = int(np.searchsorted(self.offsets, pos, side='right')) - 1
+            mask[row] = True
+            pos = self.blob.find(needle, int(self.offsets[row + 1]))
+        return mask
+
+    def contains_rows(self, needle: str, rows: np.ndarray) -> np.ndarray:
+        """Per-row check for rows, cheaper than a full scan when few rows survive"""
+        needle = needle.encode()
+        offsets = self.offsets
+        return np.fromiter(
+            (self.blob.find(needle, offsets[row], offsets[row + 1] - 1) != -1 for row in rows),
+            dtype=bool, count=len(rows),
+        )
+
+class CategoricalColumn:
+    """Dictionary-encoded strings"""
+
+    def __init__(self, categories: List[str], codes: np.ndarray):
+        self.categories = categories
+        self.codes = codes
+
+    @classmethod
+    def from_strings(cls, values: Sequence[str]) -> 'CategoricalColumn':
+        lookup: Dict[str, int] = {}
+        codes = np.fromiter((lookup.setdefault(value, len(lookup)) for value in values), dtype=np.int32, count=len(values))
+        return cls(list(lookup), codes)
+
+    def __getitem__(self, row: int) -> str:
+        return self.categories[self.codes[row]]
+
+    def isin(self, values: Iterable[str]) -> np.ndarray:
+        values = set(values)
+        wanted = np.zeros(len(self.categories), dtype=bool)
+        wanted[[i for i, category in enumerate(self.categories) if category in values]] = True
+        return wanted[self.codes]
+
+class ColumnarStore:
+    """NumPy-backed feedback table; Feedback models are only built for returned rows."""
+
+    def __init__(self, ids: np.ndarray, text: Dict[str, TextColumn], lowered: Dict[str, TextColumn],
+                 categories: Dict[str, CategoricalColumn], timestamps: np.ndarray, utc_offsets: np.ndarray,
+                 cluster_keys: List[str], cluster_offsets: np.ndarray, cluster_members: np.ndarray,
+                 row_cluster: np.ndarray, tagged_clusters: TaggedClusters, id_order: Optional[np.ndarray] = None):
+        self.ids = ids
+        self.text = text
+        self.lowered = lowered
+        self.categories = categories
+        self.timestamps = timestamps
+        self.utc_offsets = utc_offsets
+        self.days = timestamps // US_PER_DAY
+        self.id_order = np.argsort(ids, kind='stable') if id_order is None else id_order
+        self.sorted_ids = ids[self.id_order]
+
+        self.cluster_keys = cluster_keys
+        self.cluster_offsets = cluster_offsets
+        self.cluster_members = cluster_members
+        self.row_cluster = row_cluster
+
+        clusters = [tagged_clusters.root[key] for key in cluster_keys]
+        # trailing 0 entry serves rows outside every cluster (row_cluster == -1)
+        self.columns: Dict[str, np.ndarray] = {
+            'importance_score': np.array([c.importance_score for c in clusters] + [0.0], dtype=np.float64)[row_cluster],
+            'customer_impact': np.array([c.customer_impact for c in clusters] + [0], dtype=np.int64)[row_cluster],
+        }
+        self.tag_clusters: Dict[str, List[int]] = {}
+        for code, cluster in enumerate(clusters):
+            for tag in cluster.tags:
+                self.tag_clusters.setdefault(tag, []).append(code)
+        self.text_indexes: Dict[str, TextIndex] = {}
+        self._exclusive_clusters: Optional[bool] = None
+        # built here rather than on first use: filters run on a thread pool and must never see half of the pair
+        self.date_order = np.argsort(self.days, kind='stable')
+        self.sorted_days = self.days[self.date_order]
+
+    @classmethod
+    def from_records(cls, records: List[Dict[str, Any]], tagged_clusters: TaggedClusters) -> 'ColumnarStore':
+        dates = _datetimes.validate_python([record['date'] for record in records])
+        ids = np.array([int(record['id']) for record in records], dtype=np.int64)
+        timestamps = np.array([dt.replace(tzinfo=None) for dt in dates], dtype='datetime64[us]').astype(np.int64)
+        utc_offsets = np.array(
+            [NAIVE if dt.utcoffset() is None else dt.utcoffset() // timedelta(minutes=1) for dt in dates],
+            dtype=np.int32,
+        )
+
+        id_order = np.argsort(ids, kind='stable')
+        sorted_ids = ids[id_order]
+        cluster_keys = list(tagged_clusters.root)
+        members = [_rows_for_ids(sorted_ids, id_order, tagged_clusters.root[key].ids) for key in cluster_keys]
+        cluster_offsets = np.zeros(len(members) + 1, dtype=np.int64)
+        np.cumsum([len(rows) for rows in members], out=cluster_offsets[1:])
+        row_cluster = np.full(len(records), -1, dtype=np.int32)
+        # assign in reverse so a row listed under several clusters keeps the first one
+        for code in range(len(members) - 1, -1, -1):
+            row_cluster[members[code]] = code
+
+        return cls(
+            ids=ids,
+            text={field: TextColumn.from_strings([r[field] for r in records]) for field in TEXT_FIELDS},
+            lowered={field: TextColumn.from_strings([r[field].lower() for r in records]) for field in TEXT_FIELDS},
+            categories={field: CategoricalColumn.from_strings([r[field] for r in records]) for field in CATEGORICAL_FIELDS},
+            timestamps=timestamps,
+            utc_offsets=utc_offsets,
+            cluster_keys=cluster_keys,
+            cluster_offsets=cluster_offsets,
+            cluster_members=np.concatenate(members) if members else np.zeros(0, dtype=np.int64),
+            row_cluster=row_cluster,
+            tagged_clusters=tagged_clusters,
+            id_order=id_order,
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def text_index(self, field: str) -> TextIndex:
+        """Built on first token search so substring-only deployments never pay for it"""
+        if field not in self.text_indexes:
+            self.text_indexes[field] = TextIndex(self.lowered[field].strings())
+        return self.text_indexes[field]
+
+    def cluster_rows(self, code: int) -> np.ndarray:
+        return self.cluster_members[self.cluster_offsets[code]:self.cluster_offsets[code + 1]]
+
+    def cluster_for(self, feedback_id: int) -> Optional[str]:
+        row = self.row_of(feedback_id)
+        if row is None or self.row_cluster[row] < 0:
+            return None
+        return self.cluster_keys[self.row_cluster[row]]
+
+    def clusters_at(self, rows: Sequence[int]) -> List[Optional[str]]:
+        """Cluster key per row from one gather over row_cluster"""
+        codes = self.row_cluster[np.asarray(rows, dtype=np.int64)].tolist()
+        return [self.cluster_keys[code] if code >= 0 else None for code in codes]
+
+    def row_of(self, feedback_id: int) -> Optional[int]:
+        rows = _rows_for_ids(self.sorted_ids, self.id_order, [str(feedback_id)])
+        return int(rows[0]) if len(rows) else None
+
+    def id_at(self, row: int) -> int:
+        return int(self.ids[row])
+
+    def facets(self, rows: np.ndarray) -> FacetCounts:
+        """Categorical, tag, day and cluster counts over rows, all from bincounts"""
+        rows = np.asarray(rows, dtype=np.int64)
+        categorical = {}
+        for field in CATEGORICAL_FIELDS:
+            column = self.categories[field]
+            counts = np.bincount(column.codes[rows], minlength=len(column.categories))
+            categorical[field] = {column.categories[code]: int(counts[code]) for code in np.flatnonzero(counts)}
+        days, day_counts = np.unique(self.days[rows], return_counts=True)
+
+        # matching members per cluster from the CSR membership lists
+        selected = np.zeros(len(self), dtype=bool)
+        selected[rows] = True
+        hits = np.concatenate([[0], np.cumsum(selected[self.cluster_members])])
+        per_cluster = hits[self.cluster_offsets[1:]] - hits[self.cluster_offsets[:-1]]
+
+        if self._exclusive_clusters is None:
+            self._exclusive_clusters = len(np.unique(self.cluster_members)) == len(self.cluster_members)
+        tags = {}
+        for tag, codes in self.tag_clusters.items():
+            if self._exclusive_clusters:
+                tags[tag] = int(per_cluster[codes].sum())
+            else:
+                # a row in several clusters sharing the tag counts once
+                members = np.concatenate([self.cluster_rows(code) for code in codes])
+                tags[tag] = int(np.count_nonzero(selected[np.unique(members)]))
+
+        return FacetCounts(
+            total=len(rows),
+            categorical=categorical,
+            tags=tags,
+            days={(EPOCH + timedelta(days=int(day))).date(): int(count) for day, count in zip(days, day_counts)},
+            clusters={self.cluster_keys[code]: int(count) for code, count in enumerate(per_cluster) if count},
+        )
+
+    def day_ordinals(self) -> np.ndarray:
+        return self.days + EPOCH_ORDINAL
+
+    def memberships(self, dimension: str) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        """(keys, rows, codes) pairing each row with every cluster, tag or categorical value it falls under"""
+        if dimension == 'cluster':
+            codes = np.repeat(np.arange(len(self.cluster_keys)), np.diff(self.cluster_offsets))
+            return list(self.cluster_keys), self.cluster_members, codes
+        if dimension == 'tag':
+            tags = list(self.tag_clusters)
+            members = [np.unique(np.concatenate([self.cluster_rows(code) for code in self.tag_clusters[tag]])) for tag in tags]
+            rows = np.concatenate(members) if members else np.zeros(0, dtype=np.int64)
+            return tags, rows, np.repeat(np.arange(len(tags)), [len(m) for m in members])
+        column = self.categories[dimension]
+        return list(column.categories), np.arange(len(self)), column.codes
+
+    def date_rows(self, start: int, end: int) -> np.ndarray:
+        """Rows dated within ordinal days start..end inclusive"""
+        lo, hi = np.searchsorted(self.sorted_days, [start - EPOCH_ORDINAL, end - EPOCH_ORDINAL + 1])
+        return self.date_order[lo:hi]
+
+    def rows_for_ids(self, feedback_ids: Sequence[int]) -> np.ndarray:
+        """First row of each feedback id, -1 for ids not in the table"""
+        wanted = np.asarray(feedback_ids, dtype=np.int64)
+        if not len(self):
+            return np.full(len(wanted), -1, dtype=np.int64)
+        positions = np.minimum(np.searchsorted(self.sorted_ids, wanted), len(self) - 1)
+        return np.where(self.sorted_ids[positions] == wanted, self.id_order[positions], -1).astype(np.int64)
+
+    def mask(self, filters: Dict[str, Any]) -> np.ndarray:
+        mask = np.ones(len(self), dtype=bool)
+        remaining = len(self)
+
+        def finish(stage: str, start: float) -> None:
+            nonlocal remaining
+            rows_in, remaining = remaining, int(np.count_nonzero(mask))
+            record_stage('columnar', stage, time.perf_counter() - start, rows_in, remaining)
+
+        for field in CATEGORICAL_FIELDS:
+            if filters.get(field):
+                start = time.perf_counter()
+                mask &= self.categories[field].isin(filters[field])
+                finish(field, start)
+
+        bounds = day_bounds(filters)
+        if bounds:
+            start = time.perf_counter()
+            dated = np.zeros(len(self), dtype=bool)
+            dated[self.date_rows(*bounds)] = True
+            mask &= dated
+            finish('date', start)
+
+        for field in RANGE_FIELDS:
+            if filters.get(field):
+                start = time.perf_counter()
+                column = self.columns[field]
+                mask &= (column >= min(filters[field])) & (column <= max(filters[field]))
+                finish(field, start)
+
+        if filters.get('tags'):
+            start = time.perf_counter()
+            codes = sorted({code for tag in filters['tags'] for code in self.tag_clusters.get(tag, ())})
+            tagged = np.zeros(len(self), dtype=bool)
+            if codes:
+                tagged[np.concatenate([self.cluster_rows(code) for code in codes])] = True
+            mask &= tagged
+            finish('tags', start)
+
+        for field in TEXT_FIELDS:
+            if filters.get(field) and remaining:
+                start = time.perf_counter()
+                if filters.get('text_match') == 'tokens':
+                    mask &= self.text_index(field).match(filters[field])
+                else:
+                    column, needle = self.lowered[field], filters[field].lower()
+                    candidates = np.flatnonzero(mask)
+                    if len(candidates) * SPARSE_TEXT_RATIO < len(self):
+                        mask[candidates] = column.contains_rows(needle, candidates)
+                    else:
+                        mask &= column.contains(needle)
+                finish(field, start)
+
+        return mask
+
+    def search(self, filters: Dict[str, Any]) -> np.ndarray:
+        """Row positions matching all filters, in table order"""
+        return np.flatnonzero(self.mask(filters))
+
+    def date(self, row: int) -> datetime:
+        value = EPOCH + timedelta(microseconds=int(self.timestamps[row]))
+        offset = int(self.utc_offsets[row])
+        return value if offset == NAIVE else value.replace(tzinfo=timezone(timedelta(minutes=offset)))
+
+    def feedback(self, rows: Iterable[int]) -> List[Feedback]:
+        return [
+            Feedback(
+                id=int(self.ids[row]),
+                date=self.date(row),
+                **{field: self.text[field][row] for field in TEXT_FIELDS},
+                **{field: self.categories[field][row] for field in CATEGORICAL_FIELDS},
+            )
+            for row in rows
+        ]
+
+def _rows_for_ids(sorted_ids: np.ndarray, id_order: np.ndarray, feedback_ids: Sequence[str]) -> np.ndarray:
+    """Row positions whose str(id) is one of feedback_ids"""
+    wanted = np.array([int(i) for i in feedback_ids if i.lstrip('-').isdigit() and str(int(i)) == i], dtype=np.int64)
+    lo = np.searchsorted(sorted_ids, wanted, side='left')
+    counts = np.searchsorted(sorted_ids, wanted, side='right') - lo
+    starts = np.repeat(lo - np.cumsum(counts) + counts, counts)
+    return id_order[np.arange(counts.sum()) + starts]
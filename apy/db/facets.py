@@ -0,0 +1,49 @@
+from datetime import date, timedelta
+from typing import Dict, NamedTuple
+from schemas import ClusterSummary, FacetsResponse, TaggedClusters
+
+DATE_BUCKETS = ('day', 'week', 'month')
+
+class FacetCounts(NamedTuple):
+    """Raw counts over a filtered row set, as produced by FeedbackIndex.facets / ColumnarStore.facets"""
+    total: int
+    categorical: Dict[str, Dict[str, int]]
+    tags: Dict[str, int]
+    days: Dict[date, int]
+    clusters: Dict[str, int]  # matching members per cluster
+
+def bucket_start(day: date, bucket: str) -> date:
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+def bucket_counts(days: Dict[date, int], bucket: str) -> Dict[str, int]:
+    """Per-day counts rolled up to ISO start dates of day/week (Monday)/month buckets, oldest first"""
+    buckets: Dict[date, int] = {}
+    for day, count in days.items():
+        start = bucket_start(day, bucket)
+        buckets[start] = buckets.get(start, 0) + count
+    return {start.isoformat(): buckets[start] for start in sorted(buckets)}
+
+def build_facets(counts: FacetCounts, tagged_clusters: TaggedClusters, bucket: str) -> FacetsResponse:
+    clusters = {
+        key: ClusterSummary(
+            count=count,
+            importance_score=tagged_clusters.root[key].importance_score,
+            customer_impact=tagged_clusters.root[key].customer_impact,
+        )
+        for key, count in sorted(counts.clusters.items(), key=lambda item: (-item[1], item[0])) if count
+    }
+    scores = [summary.importance_score for summary in clusters.values()]
+    impacts = [summary.customer_impact for summary in clusters.values()]
+    return FacetsResponse(
+        total=counts.total,
+        **{field: dict(sorted(values.items(), key=lambda item: (-item[1], item[0]))) for field, values in counts.categorical.items()},
+        tags=dict(sorted(((tag, count) for tag, count in counts.tags.items() if count), key=lambda item: (-item[1], item[0]))),
+        date=bucket_counts(counts.days, bucket),
+        clusters=clusters,
+        importance_score_range={"min": min(scores, default=0.0), "max": max(scores, default=0.0)},
+        customer_impact_range={"min": min(impacts, default=0), "max": max(impacts, default=0)},
+    )
@@ -0,0 +1,254 @@
+import bisect
+import time
+from collections import Counter, defaultdict
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple
+import numpy as np
+from instrumentation import record_stage
+from schemas import Feedback, TaggedClusters
+from .facets import FacetCounts
+from .text_search import TextIndex
+
+CATEGORICAL_FIELDS = ('importance', 'type', 'customer')
+TEXT_FIELDS = ('name', 'description')
+RANGE_FIELDS = ('importance_score', 'customer_impact')
+DATE_FIELDS = ('date', 'date_from', 'date_to')
+
+def day_ordinal(value: str) -> int:
+    return datetime.fromisoformat(value).date().toordinal()
+
+def day_bounds(filters: Dict[str, Any]) -> Optional[Tuple[int, int]]:
+    """Inclusive ordinal day range selected by date / date_from / date_to, None when none is set"""
+    if not any(filters.get(field) for field in DATE_FIELDS):
+        return None
+    start = max((day_ordinal(filters[field]) for field in ('date', 'date_from') if filters.get(field)), default=1)
+    end = min((day_ordinal(filters[field]) for field in ('date', 'date_to') if filters.get(field)), default=date.max.toordinal())
+    return start, end
+
+class Step(NamedTuple):
+    field: str
+    estimate: int
+    fetch: Callable[[], Set[int]]
+    accepts: Callable[[int], bool]
+
+class FeedbackIndex:
+    """In-memory indexes over the feedback table, addressed by row position."""
+
+    def __init__(self, feedback_data: List[Feedback], tagged_clusters: TaggedClusters):
+        self.feedback_data = feedback_data
+        self.size = len(feedback_data)
+        self.text: Dict[str, List[str]] = {
+            field: [getattr(f, field).lower() for f in feedback_data] for field in TEXT_FIELDS
+        }
+        self.text_indexes: Dict[str, TextIndex] = {}
+
+        self.columns: Dict[str, list] = {
+            field: [getattr(f, field) for f in feedback_data] for field in CATEGORICAL_FIELDS
+        }
+        self.postings: Dict[str, Dict[str, Set[int]]] = {field: defaultdict(set) for field in CATEGORICAL_FIELDS}
+        for field, column in self.columns.items():
+            index = self.postings[field]
+            for row, value in enumerate(column):
+                index[value].add(row)
+            self.postings[field] = dict(index)
+
+        self.days: List[int] = [f.date.date().toordinal() for f in feedback_data]
+        by_day = sorted((day, row) for row, day in enumerate(self.days))
+        self.date_keys: List[int] = [day for day, _ in by_day]
+        self.date_rows: List[int] = [row for _, row in by_day]
+
+        self._index_clusters(feedback_data, tagged_clusters)
+
+    def _index_clusters(self, feedback_data: List[Feedback], tagged_clusters: TaggedClusters):
+        """feedback id -> cluster reverse index plus per-row score/impact columns"""
+        self.cluster_of: Dict[str, str] = {}
+        for key, cluster in tagged_clusters.root.items():
+            for feedback_id in cluster.ids:
+                # an id listed under several clusters takes its scores from the first one
+                self.cluster_of.setdefault(feedback_id, key)
+
+        rows_by_id: Dict[str, List[int]] = defaultdict(list)
+        for row, f in enumerate(feedback_data):
+            rows_by_id[str(f.id)].append(row)
+        self.row_of_id: Dict[int, int] = {int(feedback_id): rows[0] for feedback_id, rows in rows_by_id.items()}
+
+        self.cluster_rows: Dict[str, Set[int]] = {
+            key: {row for feedback_id in cluster.ids for row in rows_by_id.get(feedback_id, ())}
+            for key, cluster in tagged_clusters.root.items()
+        }
+        self.tag_clusters: Dict[str, Set[str]] = defaultdict(set)
+        self.row_clusters: List[Set[str]] = [set() for _ in range(self.size)]
+        for key, cluster in tagged_clusters.root.items():
+            for tag in cluster.tags:
+                self.tag_clusters[tag].add(key)
+            for row in self.cluster_rows[key]:
+                self.row_clusters[row].add(key)
+        self.tag_clusters = dict(self.tag_clusters)
+        self.cluster_tags: Dict[str, List[str]] = {key: cluster.tags for key, cluster in tagged_clusters.root.items()}
+
+        clusters = tagged_clusters.root
+        self.row_cluster: List[Optional[str]] = [self.cluster_of.get(str(f.id)) for f in feedback_data]
+        self.columns['importance_score'] = [clusters[key].importance_score if key is not None else 0.0 for key in self.row_cluster]
+        self.columns['customer_impact'] = [clusters[key].customer_impact if key is not None else 0 for key in self.row_cluster]
+
+    def __len__(self) -> int:
+        return self.size
+
+    def cluster_for(self, feedback_id: int) -> Optional[str]:
+        return self.cluster_of.get(str(feedback_id))
+
+    def clusters_at(self, rows: Sequence[int]) -> List[Optional[str]]:
+        return [self.row_cluster[row] for row in rows]
+
+    def row_of(self, feedback_id: int) -> Optional[int]:
+        return self.row_of_id.get(feedback_id)
+
+    def id_at(self, row: int) -> int:
+        return self.feedback_data[row].id
+
+    def feedback(self, rows: Iterable[int]) -> List[Feedback]:
+        return [self.feedback_data[row] for row in rows]
+
+    def facets(self, rows: Sequence[int]) -> FacetCounts:
+        """Categorical, tag, day and cluster counts over rows in one pass"""
+        categorical = {field: Counter() for field in CATEGORICAL_FIELDS}
+        tags, days, clusters = Counter(), Counter(), Counter()
+        for row in rows:
+            for field, counts in categorical.items():
+                counts[self.columns[field][row]] += 1
+            days[self.days[row]] += 1
+            keys = self.row_clusters[row]
+            clusters.update(keys)
+            tags.update({tag for key in keys for tag in self.cluster_tags[key]})
+        return FacetCounts(
+            total=len(rows),
+            categorical={field: dict(counts) for field, counts in categorical.items()},
+            tags=dict(tags),
+            days={date.fromordinal(day): count for day, count in days.items()},
+            clusters=dict(clusters),
+        )
+
+    def day_ordinals(self) -> np.ndarray:
+        return np.array(self.days, dtype=np.int64)
+
+    def memberships(self, dimension: str) -> Tuple[List[str], np.ndarray, np.ndarray]:
+        """(keys, rows, codes) pairing each row with every cluster, tag or categorical value it falls under"""
+        if dimension == 'cluster':
+            groups = self.cluster_rows
+        elif dimension == 'tag':
+            groups = {tag: set().union(*(self.cluster_rows[key] for key in keys)) for tag, keys in self.tag_clusters.items()}
+        else:
+            groups = self.postings[dimension]
+        keys = list(groups)
+        rows = np.array([row for key in keys for row in groups[key]], dtype=np.int64)
+        codes = np.repeat(np.arange(len(keys)), [len(groups[key]) for key in keys])
+        return keys, rows, codes
+
+    def rows_for_ids(self, feedback_ids: Sequence[int]) -> np.ndarray:
+        """First row of each feedback id, -1 for ids not in the table"""
+        return np.array([self.row_of_id.get(int(i), -1) for i in feedback_ids], dtype=np.int64)
+
+    def text_index(self, field: str) -> TextIndex:
+        """Built on first token search so substring-only deployments never pay for it"""
+        if field not in self.text_indexes:
+            self.text_indexes[field] = TextIndex(self.text[field])
+        return self.text_indexes[field]
+
+    def lookup(self, field: str, values: Iterable[str]) -> Set[int]:
+        index = self.postings[field]
+        matches = [index[value] for value in set(values) if value in index]
+        if len(matches) == 1:
+            return matches[0]
+        return set().union(*matches)
+
+    def date_range(self, start: int, end: int) -> Tuple[int, int]:
+        """Positions in the date index for ordinal days start..end inclusive"""
+        return bisect.bisect_left(self.date_keys, start), bisect.bisect_right(self.date_keys, end)
+
+    def plan(self, filters: Dict[str, Any]) -> List[Step]:
+        """Index-backed steps, most selective first"""
+        steps = []
+
+        for field in CATEGORICAL_FIELDS:
+            if filters.get(field):
+                index, column, values = self.postings[field], self.columns[field], set(filters[field])
+                steps.append(Step(
+                    field,
+                    sum(len(index[value]) for value in values if value in index),
+                    lambda field=field, values=values: self.lookup(field, values),
+                    lambda row, column=column, values=values: column[row] in values,
+                ))
+
+        if filters.get('tags'):
+            keys = set().union(*(self.tag_clusters.get(tag, ()) for tag in filters['tags']))
+            steps.append(Step(
+                'tags',
+                sum(len(self.cluster_rows[key]) for key in keys),
+                lambda: set().union(*(self.cluster_rows[key] for key in keys)),
+                lambda row: not keys.isdisjoint(self.row_clusters[row]),
+            ))
+
+        bounds = day_bounds(filters)
+        if bounds:
+            start, end = bounds
+            lo, hi = self.date_range(start, end)
+            steps.append(Step(
+                'date',
+                hi - lo,
+                lambda: set(self.date_rows[lo:hi]),
+                lambda row: start <= self.days[row] <= end,
+            ))
+
+        if filters.get('text_match') == 'tokens':
+            for field in TEXT_FIELDS:
+                if filters.get(field):
+                    mask = self.text_index(field).match(filters[field])
+                    matched = mask.nonzero()[0]
+                    steps.append(Step(
+                        field,
+                        len(matched),
+                        lambda matched=matched: set(matched.tolist()),
+                        lambda row, mask=mask: bool(mask[row]),
+                    ))
+
+        return sorted(steps, key=lambda step: step.estimate)
+
+    def search(self, filters: Dict[str, Any]) -> List[int]:
+        """Row positions matching all filters, in table order"""
+        start = time.perf_counter()
+        steps = self.plan(filters)
+        record_stage('rows', 'plan', time.perf_counter() - start, self.size, self.size)
+
+        candidates = None
+        for step in steps:
+            start, rows_in = time.perf_counter(), self.size if candidates is None else len(candidates)
+            if candidates is None:
+                candidates = step.fetch()
+            elif step.estimate > len(candidates):
+                # cheaper to probe the surviving rows than to materialise a larger posting set
+                candidates = {row for row in candidates if step.accepts(row)}
+            else:
+                candidates = candidates & step.fetch()
+            record_stage('rows', step.field, time.perf_counter() - start, rows_in, len(candidates))
+            if not candidates:
+                return []
+
+        rows = range(self.size) if candidates is None else sorted(candidates)
+
+        for field in RANGE_FIELDS:
+            if filters.get(field):
+                start, rows_in = time.perf_counter(), len(rows)
+                low, high = min(filters[field]), max(filters[field])
+                column = self.columns[field]
+                rows = [row for row in rows if low <= column[row] <= high]
+                record_stage('rows', field, time.perf_counter() - start, rows_in, len(rows))
+
+        for field in TEXT_FIELDS:
+            if filters.get(field) and filters.get('text_match') != 'tokens':
+                start, rows_in = time.perf_counter(), len(rows)
+                needle = filters[field].lower()
+                column = self.text[field]
+                rows = [row for row in rows if needle in column[row]]
+                record_stage('rows', field, time.perf_counter() - start, rows_in, len(rows))
+
+        return list(rows)
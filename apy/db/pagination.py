@@ -0,0 +1,38 @@
+import base64
+import bisect
+import json
+from typing import Optional, Sequence, Tuple
+
+def encode_cursor(feedback_id: int) -> str:
+    payload = json.dumps({"after": int(feedback_id)}, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+def decode_cursor(cursor: str) -> int:
+    """Id of the feedback the cursor points past; raises ValueError for anything we did not issue"""
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        after = json.loads(payload)["after"]
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+    if not isinstance(after, int):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return after
+
+def paginate(rows: Sequence[int], limit: Optional[int], cursor: Optional[str], index) -> Tuple[Sequence[int], Optional[str]]:
+    """
+    Slice ascending row positions after cursor; next cursor is None on the last page.
+    Cursors carry the last feedback id rather than its row position, so a page requested after a data
+    reload resumes after that feedback in the new table, and fails if that feedback is gone.
+    index is the FeedbackIndex or ColumnarStore the rows come from.
+    """
+    start = 0
+    if cursor:
+        after = index.row_of(decode_cursor(cursor))
+        if after is None:
+            raise ValueError("Cursor points past feedback that no longer exists; restart from the first page")
+        start = bisect.bisect_right(rows, after)
+    if limit is None:
+        return rows[start:], None
+    page = rows[start:start + limit]
+    next_cursor = encode_cursor(index.id_at(page[-1])) if start + limit < len(rows) else None
+    return page, next_cursor
@@ -1,75 +1,212 @@
+import hashlib
 import json
-from datetime import datetime
-from typing import List, Dict, Any
-from schemas import Feedback, TaggedClusters
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Iterable, NamedTuple, Optional, Sequence, Tuple
+import numpy as np
+from schemas import Feedback, TaggedClusters, TagsResponse, TrendsResponse
+from .index import FeedbackIndex, TEXT_FIELDS, day_ordinal
+from .columnar import ColumnarStore
+from .facets import DATE_BUCKETS, build_facets
+from .snapshot import SNAPSHOT_PATH, load_snapshot, source_stamps
+from .text_search import TEXT_MATCH_MODES, rank_rows
+from .trends import TREND_BUCKETS, TREND_DIMENSIONS, TrendRollups
+from .vectors import EMBEDDINGS_PATH, EmbeddingStore, load_embeddings
+
+STORAGE_MODES = ('rows', 'columnar')
+FACET_CACHE_SIZE = 256
+
+class TagAggregates(NamedTuple):
+    """/tags payload computed once per load, pre-serialized with a content ETag"""
+    version: int
+    summary: TagsResponse
+    body: bytes
+    etag: str
+
+class FacetAggregates(NamedTuple):
+    """Serialized facets for one filter; the ETag hashes the body, so it changes whenever the counts do"""
+    body: bytes
+    etag: str
 
 class PseudoDB:
-    def __init__(self):
+    def __init__(self, storage: str = 'rows', snapshot_path: Optional[str] = SNAPSHOT_PATH, text_match: str = 'substring',
+                 embeddings_path: Optional[str] = EMBEDDINGS_PATH):
+        """
+        storage='columnar' keeps feedback in NumPy columns and only builds Feedback models for returned rows.
+        A fresh snapshot under snapshot_path is memory-mapped instead of parsing the JSON sources and is always
+        served columnar, whatever storage says; None disables it.
+        text_match is how name/description filters match when a request does not say: 'substring' or
+        'tokens' (inverted index with prefix matching; filter_feedback then ranks by BM25).
+        Embeddings saved by run_cluster.py under embeddings_path back similar_feedback; None disables it.
+        """
+        if storage not in STORAGE_MODES:
+            raise ValueError(f"Unknown storage mode {storage!r}, expected one of {STORAGE_MODES}")
+        if text_match not in TEXT_MATCH_MODES:
+            raise ValueError(f"Unknown text match {text_match!r}, expected one of {TEXT_MATCH_MODES}")
+        self.requested_storage = storage
+        self.text_match = text_match
+        self.embeddings_path = embeddings_path
+        self.snapshot_path = snapshot_path
         self.feedback_data: List[Feedback] = []
         self.tagged_clusters: TaggedClusters = TaggedClusters(root={})
+        self.version = 0
         self._load_data()
 
     def _load_data(self):
-        with open('db/data.json', 'r') as f:
-            feedback_data = json.load(f)
+        snapshot = load_snapshot(self.snapshot_path, source_stamps()) if self.snapshot_path else None
+        if snapshot:
+            store, self.tagged_clusters = snapshot
+        else:
+            with open('db/data.json', 'r') as f:
+                feedback_data = json.load(f)
+
+            with open('db/updated_tagged_clusters.json', 'r') as f:
+                self.tagged_clusters = TaggedClusters(root=json.load(f))
+
+        # building a Feedback per snapshot row would cost more than parsing the JSON, so snapshots stay columnar
+        self.storage = 'columnar' if snapshot else self.requested_storage
+        if self.storage == 'columnar':
+            self.feedback_data = []
+            self.index = store if snapshot else ColumnarStore.from_records(feedback_data, self.tagged_clusters)
+        else:
             self.feedback_data = [Feedback(**item) for item in feedback_data]
+            self.index = FeedbackIndex(self.feedback_data, self.tagged_clusters)
 
-        with open('db/updated_tagged_clusters.json', 'r') as f:
-            self.tagged_clusters = TaggedClusters(root=json.load(f))
+        self.embeddings: Optional[EmbeddingStore] = load_embeddings(self.embeddings_path) if self.embeddings_path else None
+        self.embedding_rows = self.index.rows_for_ids(self.embeddings.ids) if self.embeddings else None
+
+        self.version += 1
+        self.tag_aggregates = self._aggregate_tags()
+        self.trends = TrendRollups.from_index(self.index)
+        self.facet_cache: "OrderedDict[str, FacetAggregates]" = OrderedDict()
+        self.facet_lock = threading.Lock()
+
+    def _aggregate_tags(self) -> TagAggregates:
+        all_tags = set()
+        importance_scores = []
+        customer_impacts = []
+
+        for cluster in self.tagged_clusters.root.values():
+            all_tags.update(cluster.tags)
+            importance_scores.append(cluster.importance_score)
+            customer_impacts.append(cluster.customer_impact)
+
+        summary = TagsResponse(
+            tags=sorted(all_tags),
+            importance_score_range={
+                "min": min(importance_scores, default=0.0),
+                "max": max(importance_scores, default=0.0)
+            },
+            customer_impact_range={
+                "min": min(customer_impacts, default=0),
+                "max": max(customer_impacts, default=0)
+            }
+        )
+        body = summary.model_dump_json().encode()
+        # content hash rather than version so every worker serving the same data agrees
+        etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        return TagAggregates(self.version, summary, body, etag)
 
     def get_all_feedback(self) -> List[Feedback]:
+        if self.storage == 'columnar':
+            return self.index.feedback(range(len(self.index)))
         return self.feedback_data
 
     def get_tagged_clusters(self) -> TaggedClusters:
         return self.tagged_clusters
 
-    def filter_feedback(self, filters: Dict[str, Any]) -> List[Feedback]:
-        filtered_feedback = self.feedback_data
-
-        if filters.get('name'):
-            filtered_feedback = [f for f in filtered_feedback if filters['name'].lower() in f.name.lower()]
-
-        if filters.get('description'):
-            filtered_feedback = [f for f in filtered_feedback if filters['description'].lower() in f.description.lower()]
-
-        if filters.get('importance'):
-            filtered_feedback = [f for f in filtered_feedback if f.importance in filters['importance']]
+    def get_tag_aggregates(self) -> TagAggregates:
+        return self.tag_aggregates
+
+    def get_facets(self, filters: Dict[str, Any], date_bucket: str = 'day') -> FacetAggregates:
+        """
+        Counts by importance, type, customer, tag and date bucket plus per-cluster summaries for the rows
+        matching filters, computed in one pass and cached per (filters, bucket) until the next load
+        """
+        if date_bucket not in DATE_BUCKETS:
+            raise ValueError(f"Unknown date bucket {date_bucket!r}, expected one of {DATE_BUCKETS}")
+        filters = self._with_defaults(filters)
+        key = hashlib.sha256(json.dumps([filters, date_bucket], sort_keys=True).encode()).hexdigest()
+        with self.facet_lock:
+            cached = self.facet_cache.get(key)
+            if cached is not None:
+                self.facet_cache.move_to_end(key)
+                return cached
+
+        facets = build_facets(self.index.facets(self.index.search(filters)), self.tagged_clusters, date_bucket)
+        body = facets.model_dump_json().encode()
+        aggregates = FacetAggregates(body, f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+        with self.facet_lock:
+            self.facet_cache[key] = aggregates
+            while len(self.facet_cache) > FACET_CACHE_SIZE:
+                self.facet_cache.popitem(last=False)
+        return aggregates
+
+    def get_trends(self, dimension: str, bucket: str = 'day', date_from: Optional[str] = None, date_to: Optional[str] = None,
+                   keys: Optional[List[str]] = None, limit: int = 10) -> TrendsResponse:
+        """Daily or weekly counts per cluster, tag, customer, importance or type, from the rollups built at load"""
+        if dimension not in TREND_DIMENSIONS:
+            raise ValueError(f"Unknown trend dimension {dimension!r}, expected one of {TREND_DIMENSIONS}")
+        if bucket not in TREND_BUCKETS:
+            raise ValueError(f"Unknown trend bucket {bucket!r}, expected one of {TREND_BUCKETS}")
+        start = day_ordinal(date_from) if date_from else None
+        end = day_ordinal(date_to) if date_to else None
+        return self.trends.series(dimension, bucket, start, end, keys, limit)
+
+    def _with_defaults(self, filters: Dict[str, Any]) -> Dict[str, Any]:
+        return filters if filters.get('text_match') else {**filters, 'text_match': self.text_match}
 
-        if filters.get('type'):
-            filtered_feedback = [f for f in filtered_feedback if f.type in filters['type']]
-
-        if filters.get('customer'):
-            filtered_feedback = [f for f in filtered_feedback if f.customer in filters['customer']]
-
-        if filters.get('date'):
-            date = datetime.fromisoformat(filters['date'])
-            filtered_feedback = [f for f in filtered_feedback if f.date.date() == date.date()]
-
-        if filters.get('importance_score'):
-            min_score, max_score = min(filters['importance_score']), max(filters['importance_score'])
-            filtered_feedback = [f for f in filtered_feedback if min_score <= self.get_importance_score(f) <= max_score]
-
-        if filters.get('customer_impact'):
-            min_impact, max_impact = min(filters['customer_impact']), max(filters['customer_impact'])
-            filtered_feedback = [f for f in filtered_feedback if min_impact <= self.get_customer_impact(f) <= max_impact]
-
-        if filters.get('tags'):
-            tag_ids = set()
-            for cluster in self.tagged_clusters.root.values():
-                if any(tag in cluster.tags for tag in filters['tags']):
-                    tag_ids.update(cluster.ids)
-            filtered_feedback = [f for f in filtered_feedback if str(f.id) in tag_ids]
+    def filter_feedback(self, filters: Dict[str, Any]) -> List[Feedback]:
+        """Matching feedback in table order, or most relevant first for token text searches"""
+        filters = self._with_defaults(filters)
+        rows = self.index.search(filters)
+        queries = {field: filters[field] for field in TEXT_FIELDS if filters.get(field)}
+        if filters['text_match'] == 'tokens' and queries:
+            rows = rank_rows({field: self.index.text_index(field) for field in queries}, queries, rows)
+        return self.index.feedback(rows)
+
+    def filter_rows(self, filters: Dict[str, Any]) -> Sequence[int]:
+        """Ascending row positions matching filters, without building Feedback models"""
+        return self.index.search(self._with_defaults(filters))
+
+    def get_feedback(self, rows: Iterable[int]) -> List[Feedback]:
+        return self.index.feedback(rows)
+
+    def get_embedding(self, field: str, feedback_id: int) -> Optional[np.ndarray]:
+        if self.embeddings is None or field not in self.embeddings.indexes:
+            return None
+        return self.embeddings.vector(field, feedback_id)
+
+    def similar_feedback(self, vector: np.ndarray, field: str = 'description', k: int = 10,
+                         exclude_id: Optional[int] = None) -> List[Tuple[Feedback, float]]:
+        """The k feedback items whose field embedding is most cosine-similar to vector"""
+        if self.embeddings is None or field not in self.embeddings.indexes:
+            return []
+        positions, scores = self.embeddings.indexes[field].search(vector, k + (exclude_id is not None))
+        rows = self.embedding_rows[positions]
+        keep = rows >= 0
+        if exclude_id is not None:
+            keep &= self.embeddings.ids[positions] != exclude_id
+        rows, scores = rows[keep][:k], scores[keep][:k]
+        return list(zip(self.index.feedback(rows.tolist()), scores.tolist()))
+
+    def get_clusters_for(self, feedback_list: Iterable[Feedback]) -> TaggedClusters:
+        """Only the clusters the given feedback belongs to"""
+        clusters = {}
+        for feedback in feedback_list:
+            key = self.index.cluster_for(feedback.id)
+            if key is not None and key not in clusters:
+                clusters[key] = self.tagged_clusters.root[key]
+        return TaggedClusters(root=clusters)
+
+    def get_cluster_keys(self, rows: Sequence[int]) -> List[Optional[str]]:
+        """Cluster key of each row position, looked up for the whole batch at once"""
+        return self.index.clusters_at(rows)
 
-        return filtered_feedback
-    
     def get_importance_score(self, feedback: Feedback) -> float:
-        for cluster in self.tagged_clusters.root.values():
-            if str(feedback.id) in cluster.ids:
-                return cluster.importance_score
-        return 0.0
+        key = self.index.cluster_for(feedback.id)
+        return self.tagged_clusters.root[key].importance_score if key is not None else 0.0
 
     def get_customer_impact(self, feedback: Feedback) -> int:
-        for cluster in self.tagged_clusters.root.values():
-            if str(feedback.id) in cluster.ids:
-                return cluster.customer_impact
-        return 0
+        key = self.index.cluster_for(feedback.id)
+        return self.tagged_clusters.root[key].customer_impact if key is not None else 0
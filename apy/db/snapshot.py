@@ -0,0 +1,142 @@
+"""
+Pickle-free on-disk snapshot of a ColumnarStore.
+
+Layout of a snapshot directory:
+    CURRENT                 name of the live generation, swapped atomically on save
+    <generation>/manifest.json
+    <generation>/*.npy      numeric columns, loaded with mmap_mode='r'
+    <generation>/*.bin      packed UTF-8 text buffers, mapped with mmap
+
+Workers map the same files read-only, so pages are shared across processes
+and booting costs a few opens rather than parsing data.json.
+"""
+import json
+import mmap
+import os
+import shutil
+import time
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from schemas import TaggedClusters
+from .columnar import CategoricalColumn, ColumnarStore, TextColumn
+from .index import CATEGORICAL_FIELDS, TEXT_FIELDS
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_PATH = 'db/snapshot'
+SOURCE_PATHS = ('db/data.json', 'db/updated_tagged_clusters.json')
+
+def source_stamps(paths: Tuple[str, ...] = SOURCE_PATHS) -> Dict[str, List[int]]:
+    """(size, mtime_ns) of each source file, recorded so stale snapshots are ignored"""
+    return {path: [os.stat(path).st_size, os.stat(path).st_mtime_ns] for path in paths}
+
+def save_snapshot(store: ColumnarStore, tagged_clusters: TaggedClusters, path: str = SNAPSHOT_PATH,
+                  sources: Optional[Dict[str, List[int]]] = None) -> str:
+    os.makedirs(path, exist_ok=True)
+    generation = f"{time.time_ns():x}"
+    target = os.path.join(path, generation)
+    os.makedirs(target)
+
+    arrays = {
+        'ids': store.ids,
+        'id_order': store.id_order,
+        'timestamps': store.timestamps,
+        'utc_offsets': store.utc_offsets,
+        'cluster_offsets': store.cluster_offsets,
+        'cluster_members': store.cluster_members,
+        'row_cluster': store.row_cluster,
+    }
+    for field in CATEGORICAL_FIELDS:
+        arrays[f'{field}.codes'] = store.categories[field].codes
+    texts = {f'{field}': store.text[field] for field in TEXT_FIELDS}
+    texts.update({f'{field}.lower': store.lowered[field] for field in TEXT_FIELDS})
+    for name, column in texts.items():
+        arrays[f'{name}.offsets'] = column.offsets
+        with open(os.path.join(target, f'{name}.bin'), 'wb') as f:
+            f.write(column.blob)
+    for name, array in arrays.items():
+        np.save(os.path.join(target, f'{name}.npy'), np.ascontiguousarray(array), allow_pickle=False)
+
+    manifest = {
+        'version': SNAPSHOT_VERSION,
+        'rows': len(store),
+        'categories': {field: store.categories[field].categories for field in CATEGORICAL_FIELDS},
+        'cluster_keys': store.cluster_keys,
+        'tagged_clusters': tagged_clusters.model_dump(),
+        'sources': sources if sources is not None else {},
+    }
+    with open(os.path.join(target, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f)
+
+    pointer = os.path.join(path, 'CURRENT')
+    try:
+        with open(pointer) as f:
+            previous = f.read().strip()
+    except FileNotFoundError:
+        previous = None
+    with open(pointer + '.tmp', 'w') as f:
+        f.write(generation)
+    os.replace(pointer + '.tmp', pointer)
+
+    # the previous generation stays until the next save, so a reader that just read the old CURRENT can
+    # still map it; readers holding maps of older generations keep their inodes alive after removal
+    for name in os.listdir(path):
+        if name not in (generation, previous) and os.path.isdir(os.path.join(path, name)):
+            shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+    return target
+
+def _map(file_path: str):
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def load_snapshot(path: str = SNAPSHOT_PATH, sources: Optional[Dict[str, List[int]]] = None) -> Optional[Tuple[ColumnarStore, TaggedClusters]]:
+    """Memory-map the current snapshot; None if missing, another version, or built from other sources"""
+    try:
+        with open(os.path.join(path, 'CURRENT')) as f:
+            target = os.path.join(path, f.read().strip())
+        with open(os.path.join(target, 'manifest.json')) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    if manifest['version'] != SNAPSHOT_VERSION or (sources is not None and manifest['sources'] != sources):
+        return None
+
+    def array(name: str) -> np.ndarray:
+        return np.load(os.path.join(target, f'{name}.npy'), mmap_mode='r', allow_pickle=False)
+
+    def text(name: str) -> TextColumn:
+        return TextColumn(_map(os.path.join(target, f'{name}.bin')), array(f'{name}.offsets'))
+
+    tagged_clusters = TaggedClusters(root=manifest['tagged_clusters'])
+    try:
+        store = ColumnarStore(
+            ids=array('ids'),
+            text={field: text(field) for field in TEXT_FIELDS},
+            lowered={field: text(f'{field}.lower') for field in TEXT_FIELDS},
+            categories={
+                field: CategoricalColumn(manifest['categories'][field], array(f'{field}.codes'))
+                for field in CATEGORICAL_FIELDS
+            },
+            timestamps=array('timestamps'),
+            utc_offsets=array('utc_offsets'),
+            cluster_keys=manifest['cluster_keys'],
+            cluster_offsets=array('cluster_offsets'),
+            cluster_members=array('cluster_members'),
+            row_cluster=array('row_cluster'),
+            tagged_clusters=tagged_clusters,
+            id_order=array('id_order'),
+        )
+    except FileNotFoundError:
+        # two saves replaced the generation between reading CURRENT and mapping it; load the JSON instead
+        return None
+    return store, tagged_clusters
+
+def build_snapshot(path: str = SNAPSHOT_PATH) -> str:
+    """Snapshot the current JSON sources"""
+    sources = source_stamps()
+    with open(SOURCE_PATHS[0], 'r') as f:
+        records = json.load(f)
+    with open(SOURCE_PATHS[1], 'r') as f:
+        tagged_clusters = TaggedClusters(root=json.load(f))
+    return save_snapshot(ColumnarStore.from_records(records, tagged_clusters), tagged_clusters, path, sources)
@@ -0,0 +1,95 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, NamedTuple, Optional
+from .pseudo_db import PseudoDB
+from .snapshot import SNAPSHOT_PATH, SOURCE_PATHS
+from .vectors import EMBEDDINGS_PATH
+
+logger = logging.getLogger(__name__)
+
+class StoreState(NamedTuple):
+    generation: int
+    db: PseudoDB
+    derived: Dict[str, Any]
+
+def default_factory() -> PseudoDB:
+    return PseudoDB(
+        storage=os.getenv('PSEUDO_DB_STORAGE', 'rows'),
+        text_match=os.getenv('PSEUDO_DB_TEXT_MATCH', 'substring'),
+    )
+
+def watched_stamps() -> Dict[str, Optional[int]]:
+    """mtime_ns of the JSON sources and the snapshot/embedding pointers; None for files that do not exist yet"""
+    stamps = {}
+    for path in (*SOURCE_PATHS, os.path.join(SNAPSHOT_PATH, 'CURRENT'), os.path.join(EMBEDDINGS_PATH, 'CURRENT')):
+        try:
+            stamps[path] = os.stat(path).st_mtime_ns
+        except OSError:
+            stamps[path] = None
+    return stamps
+
+class DataStore:
+    """
+    The one PseudoDB a process serves from. A reload builds a complete new PseudoDB, plus everything
+    derived from it (e.g. the filter_data tool), before swapping a single reference, so requests
+    never see a half-built index. Readers should grab state() once per request.
+    """
+
+    def __init__(self, factory: Callable[[], PseudoDB] = default_factory):
+        self.factory = factory
+        self.derivations: Dict[str, Callable[[PseudoDB], Any]] = {}
+        self._state: Optional[StoreState] = None
+        self._reload_lock = threading.Lock()
+        self._watcher: Optional[threading.Thread] = None
+
+    def derive(self, name: str, build: Callable[[PseudoDB], Any]) -> None:
+        """Register a value recomputed from every newly loaded PseudoDB as part of the same swap"""
+        self.derivations[name] = build
+        if self._state is not None:
+            with self._reload_lock:
+                self._state.derived[name] = build(self._state.db)
+
+    def state(self) -> StoreState:
+        if self._state is None:
+            self.reload()
+        return self._state
+
+    def get(self) -> PseudoDB:
+        return self.state().db
+
+    def get_derived(self, name: str) -> Any:
+        return self.state().derived[name]
+
+    def reload(self) -> StoreState:
+        with self._reload_lock:
+            db = self.factory()
+            derived = {name: build(db) for name, build in self.derivations.items()}
+            generation = self._state.generation + 1 if self._state else 1
+            self._state = StoreState(generation, db, derived)
+            return self._state
+
+    def watch(self, interval: float) -> None:
+        """Poll the data files from a daemon thread and reload whenever they change"""
+        if self._watcher is not None:
+            return
+
+        def run():
+            seen = watched_stamps()
+            while True:
+                time.sleep(interval)
+                current = watched_stamps()
+                if current != seen:
+                    try:
+                        state = self.reload()
+                        logger.info("Reloaded data (generation %d)", state.generation)
+                    except Exception:  # keep serving the previous data and retry on the next poll
+                        logger.exception("Data reload failed")
+                    else:
+                        seen = current
+
+        self._watcher = threading.Thread(target=run, name='pseudo-db-watcher', daemon=True)
+        self._watcher.start()
+
+shared_store = DataStore()
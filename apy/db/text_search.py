@@ -0,0 +1,78 @@
+import bisect
+import re
+from collections import defaultdict
+from typing import Dict, Iterable, List, Sequence, Tuple
+import numpy as np
+
+TEXT_MATCH_MODES = ('substring', 'tokens')
+TOKEN_PATTERN = re.compile(r'\w+')
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+class TextIndex:
+    """
+    Inverted index over one text field. Every query token matches the terms it is a prefix of,
+    a row matches when all query tokens do, and matching rows are scored with BM25.
+    """
+
+    def __init__(self, documents: Iterable[str]):
+        counts: Dict[str, Dict[int, int]] = defaultdict(dict)
+        lengths = []
+        for row, document in enumerate(documents):
+            tokens = tokenize(document)
+            lengths.append(len(tokens))
+            for token in tokens:
+                postings = counts[token]
+                postings[row] = postings.get(row, 0) + 1
+
+        self.size = len(lengths)
+        self.lengths = np.array(lengths, dtype=np.float64)
+        self.average_length = float(self.lengths.mean()) if self.size and self.lengths.any() else 1.0
+        self.vocabulary: List[str] = sorted(counts)
+        self.rows: List[np.ndarray] = []
+        self.frequencies: List[np.ndarray] = []
+        for term in self.vocabulary:
+            postings = counts[term]
+            self.rows.append(np.fromiter(postings.keys(), dtype=np.int64, count=len(postings)))
+            self.frequencies.append(np.fromiter(postings.values(), dtype=np.float64, count=len(postings)))
+
+    def __len__(self) -> int:
+        return self.size
+
+    def expand(self, token: str) -> range:
+        """Vocabulary positions of the terms starting with token"""
+        lo = bisect.bisect_left(self.vocabulary, token)
+        hi = bisect.bisect_left(self.vocabulary, token + '\U0010ffff', lo)
+        return range(lo, hi)
+
+    def search(self, query: str) -> Tuple[np.ndarray, np.ndarray]:
+        """(mask of matching rows, BM25 score per row); a query without tokens matches everything"""
+        tokens = list(dict.fromkeys(tokenize(query)))
+        mask = np.ones(self.size, dtype=bool)
+        scores = np.zeros(self.size, dtype=np.float64)
+        norms = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths / self.average_length)
+        for token in tokens:
+            matched = np.zeros(self.size, dtype=bool)
+            for position in self.expand(token):
+                rows, frequencies = self.rows[position], self.frequencies[position]
+                idf = np.log1p((self.size - len(rows) + 0.5) / (len(rows) + 0.5))
+                scores[rows] += idf * frequencies * (BM25_K1 + 1) / (frequencies + norms[rows])
+                matched[rows] = True
+            mask &= matched
+            if not mask.any():
+                break
+        return mask, scores
+
+    def match(self, query: str) -> np.ndarray:
+        return self.search(query)[0]
+
+def rank_rows(indexes: Dict[str, TextIndex], queries: Dict[str, str], rows: Sequence[int]) -> List[int]:
+    """rows by descending summed BM25 score over the queried fields, table order among ties"""
+    rows = np.asarray(rows, dtype=np.int64)
+    total = np.zeros(len(rows), dtype=np.float64)
+    for field, query in queries.items():
+        total += indexes[field].search(query)[1][rows]
+    return rows[np.argsort(-total, kind='stable')].tolist()
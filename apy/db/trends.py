@@ -0,0 +1,78 @@
+from datetime import date
+from typing import Dict, List, NamedTuple, Optional, Sequence
+import numpy as np
+from schemas import TrendsResponse
+from .index import CATEGORICAL_FIELDS
+
+TREND_DIMENSIONS = ('cluster', 'tag', *CATEGORICAL_FIELDS)
+TREND_BUCKETS = ('day', 'week')
+
+class Rollup(NamedTuple):
+    keys: List[str]
+    counts: Dict[str, np.ndarray]  # bucket -> (keys, buckets) counts
+
+def week_starts(days: np.ndarray) -> np.ndarray:
+    """Ordinal of the Monday on or before each ordinal day (ordinal 1 was a Monday)"""
+    return days - (days + 6) % 7
+
+class TrendRollups:
+    """
+    Daily and weekly feedback counts per cluster, tag and categorical value, built with one bincount per
+    dimension whenever the data loads, so trend charts slice precomputed arrays instead of scanning rows.
+    Buckets run without gaps from the first to the last feedback day.
+    """
+
+    def __init__(self, days: np.ndarray, memberships: Dict[str, tuple]):
+        """days: ordinal day per row; memberships: dimension -> (keys, rows, codes) as the indexes return them"""
+        first = int(days.min()) if len(days) else 0
+        span = int(days.max()) - first + 1 if len(days) else 0
+        offsets = days - first
+        daily_starts = np.arange(first, first + span, dtype=np.int64)
+        weeks = week_starts(daily_starts)
+        # first day of each week within the span, for reduceat
+        boundaries = np.flatnonzero(np.r_[True, weeks[1:] != weeks[:-1]]) if span else np.zeros(0, dtype=np.int64)
+        self.starts = {'day': daily_starts, 'week': weeks[boundaries]}
+
+        def rollup(daily: np.ndarray) -> Dict[str, np.ndarray]:
+            weekly = np.add.reduceat(daily, boundaries, axis=-1) if span else daily
+            return {'day': daily.astype(np.int32), 'week': weekly.astype(np.int32)}
+
+        self.totals = rollup(np.bincount(offsets, minlength=span))
+        self.rollups: Dict[str, Rollup] = {}
+        for dimension, (keys, rows, codes) in memberships.items():
+            flat = codes.astype(np.int64) * span + offsets[rows]
+            daily = np.bincount(flat, minlength=len(keys) * span).reshape(len(keys), span)
+            self.rollups[dimension] = Rollup(list(keys), rollup(daily))
+
+    @classmethod
+    def from_index(cls, index) -> 'TrendRollups':
+        """From a FeedbackIndex or ColumnarStore"""
+        return cls(index.day_ordinals(), {dimension: index.memberships(dimension) for dimension in TREND_DIMENSIONS})
+
+    def series(self, dimension: str, bucket: str = 'day', start: Optional[int] = None, end: Optional[int] = None,
+               keys: Optional[Sequence[str]] = None, limit: int = 10) -> TrendsResponse:
+        """
+        Counts per bucket overlapping ordinal days start..end for the given keys, or for the limit keys
+        with the most feedback in that window
+        """
+        starts = self.starts[bucket]
+        lo = 0 if start is None else int(np.searchsorted(starts, week_starts(start) if bucket == 'week' else start))
+        hi = len(starts) if end is None else int(np.searchsorted(starts, end, side='right'))
+        rollup = self.rollups[dimension]
+        counts = rollup.counts[bucket][:, lo:hi]
+
+        if keys is None:
+            totals = counts.sum(axis=1)
+            ranked = sorted(np.flatnonzero(totals), key=lambda code: (-totals[code], rollup.keys[code]))[:limit]
+            series = {rollup.keys[code]: counts[code].tolist() for code in ranked}
+        else:
+            codes = {key: code for code, key in enumerate(rollup.keys)}
+            series = {key: counts[codes[key]].tolist() if key in codes else [0] * counts.shape[1] for key in keys}
+
+        return TrendsResponse(
+            dimension=dimension,
+            bucket=bucket,
+            buckets=[date.fromordinal(int(day)).isoformat() for day in starts[lo:hi]],
+            total=self.totals[bucket][lo:hi].tolist(),
+            series=series,
+        )
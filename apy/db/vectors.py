@@ -0,0 +1,157 @@
+"""
+Feedback embeddings on disk as L2-normalised float32 matrices, one per embedded field, aligned with ids.npy.
+Saved in generations behind an atomic CURRENT pointer like the snapshot, and loaded with mmap_mode='r'
+so workers share the pages.
+"""
+import json
+import os
+import shutil
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+EMBEDDINGS_PATH = 'db/embeddings'
+EMBEDDED_FIELDS = ('name', 'description')
+SEARCH_CHUNK = 65536       # rows scored per matrix product, bounds temporary memory
+ANN_MIN_ROWS = 100_000     # below this an exact scan is fast enough
+ANN_PROBES = 8
+ANN_TRAINING_SAMPLE = 256  # rows sampled per list to train the coarse quantizer
+LOAD_ATTEMPTS = 3
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the k highest scores, best first"""
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+class IVFIndex:
+    """Inverted-file approximate search: only rows in the lists whose centroids are nearest the query are scored"""
+
+    def __init__(self, matrix: np.ndarray, n_lists: Optional[int] = None, random_state: int = 0):
+        from sklearn.cluster import MiniBatchKMeans
+
+        n_lists = n_lists or max(1, int(np.sqrt(len(matrix))))
+        rng = np.random.default_rng(random_state)
+        sample = rng.choice(len(matrix), min(len(matrix), n_lists * ANN_TRAINING_SAMPLE), replace=False)
+        quantizer = MiniBatchKMeans(n_clusters=n_lists, random_state=random_state, n_init=3)
+        quantizer.fit(np.asarray(matrix[np.sort(sample)]))
+        self.centroids = normalize(quantizer.cluster_centers_)
+
+        assignments = np.concatenate([
+            np.argmax(np.asarray(matrix[start:start + SEARCH_CHUNK]) @ self.centroids.T, axis=1)
+            for start in range(0, len(matrix), SEARCH_CHUNK)
+        ])
+        self.members = np.argsort(assignments, kind='stable')
+        self.offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignments, minlength=n_lists), out=self.offsets[1:])
+
+    def candidates(self, query: np.ndarray, probes: int = ANN_PROBES) -> np.ndarray:
+        lists = top_k(self.centroids @ query, min(probes, len(self.centroids)))
+        return np.sort(np.concatenate([self.members[self.offsets[i]:self.offsets[i + 1]] for i in lists]))
+
+class VectorIndex:
+    """Cosine top-k over one embedded field"""
+
+    def __init__(self, matrix: np.ndarray, ann_min_rows: int = ANN_MIN_ROWS):
+        self.matrix = matrix
+        # built with the data (at load or reload, off the request path) so no query pays for it or races to build it
+        self.ann: Optional[IVFIndex] = IVFIndex(matrix) if len(matrix) >= ann_min_rows else None
+
+    def __len__(self) -> int:
+        return len(self.matrix)
+
+    def search(self, query: np.ndarray, k: int, exact: Optional[bool] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (positions, cosine similarities) of the k nearest rows; approximate unless exact is set once the matrix
+        has ann_min_rows rows, always exact below that
+        """
+        query = normalize(query)
+        if self.ann is not None and not exact:
+            positions = self.ann.candidates(query)
+            scores = np.asarray(self.matrix[positions]) @ query
+            best = top_k(scores, k)
+            return positions[best], scores[best]
+
+        best_positions, best_scores = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        for start in range(0, len(self), SEARCH_CHUNK):
+            scores = np.concatenate([best_scores, np.asarray(self.matrix[start:start + SEARCH_CHUNK]) @ query])
+            positions = np.concatenate([best_positions, np.arange(start, start + len(scores) - len(best_scores))])
+            best = top_k(scores, k)
+            best_positions, best_scores = positions[best], scores[best]
+        return best_positions, best_scores
+
+class EmbeddingStore:
+    def __init__(self, ids: np.ndarray, fields: Dict[str, np.ndarray]):
+        self.ids = ids
+        self.indexes = {field: VectorIndex(matrix) for field, matrix in fields.items()}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def position(self, feedback_id: int) -> Optional[int]:
+        matches = np.flatnonzero(self.ids == feedback_id)
+        return int(matches[0]) if len(matches) else None
+
+    def vector(self, field: str, feedback_id: int) -> Optional[np.ndarray]:
+        position = self.position(feedback_id)
+        return None if position is None else np.asarray(self.indexes[field].matrix[position])
+
+def save_embeddings(ids: Sequence[int], fields: Dict[str, np.ndarray], path: str = EMBEDDINGS_PATH) -> str:
+    os.makedirs(path, exist_ok=True)
+    generation = f"{time.time_ns():x}"
+    target = os.path.join(path, generation)
+    os.makedirs(target)
+
+    np.save(os.path.join(target, 'ids.npy'), np.asarray(ids, dtype=np.int64), allow_pickle=False)
+    for field, vectors in fields.items():
+        np.save(os.path.join(target, f'{field}.npy'), np.ascontiguousarray(normalize(vectors)), allow_pickle=False)
+    with open(os.path.join(target, 'manifest.json'), 'w') as f:
+        json.dump({'rows': len(ids), 'fields': list(fields)}, f)
+
+    pointer = os.path.join(path, 'CURRENT')
+    try:
+        with open(pointer) as f:
+            previous = f.read().strip()
+    except FileNotFoundError:
+        previous = None
+    with open(pointer + '.tmp', 'w') as f:
+        f.write(generation)
+    os.replace(pointer + '.tmp', pointer)
+
+    # as in save_snapshot, the previous generation stays for readers that just resolved the old CURRENT
+    for name in os.listdir(path):
+        if name not in (generation, previous) and os.path.isdir(os.path.join(path, name)):
+            shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+    return target
+
+def load_embeddings(path: str = EMBEDDINGS_PATH) -> Optional[EmbeddingStore]:
+    """Memory-map the current generation; None if there is none"""
+    for _ in range(LOAD_ATTEMPTS):
+        try:
+            with open(os.path.join(path, 'CURRENT')) as f:
+                target = os.path.join(path, f.read().strip())
+        except FileNotFoundError:
+            return None
+        try:
+            with open(os.path.join(target, 'manifest.json')) as f:
+                manifest = json.load(f)
+            ids = np.load(os.path.join(target, 'ids.npy'), mmap_mode='r', allow_pickle=False)
+            fields = {
+                field: np.load(os.path.join(target, f'{field}.npy'), mmap_mode='r', allow_pickle=False)
+                for field in manifest['fields']
+            }
+        except FileNotFoundError:
+            # saves replaced the generation between reading CURRENT and mapping it; resolve CURRENT again
+            continue
+        return EmbeddingStore(ids, fields)
+    return None
+
+def missing_ids(store: Optional[EmbeddingStore], feedback_ids: Sequence[int]) -> List[int]:
+    known = set(store.ids.tolist()) if store is not None else set()
+    return [feedback_id for feedback_id in feedback_ids if feedback_id not in known]
@@ -0,0 +1,17 @@
+# Production serving: poetry run gunicorn app:app -c gunicorn.conf.py
+import gc
+import multiprocessing
+import os
+
+bind = os.getenv('BIND', '127.0.0.1:8000')
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = 'uvicorn.workers.UvicornWorker'
+timeout = int(os.getenv('WORKER_TIMEOUT', '60'))
+
+# load the data once in the master; forked workers share those pages copy-on-write
+# (and a memory-mapped snapshot through the page cache) instead of each parsing the JSON
+preload_app = True
+
+def pre_fork(server, worker):
+    # keep the garbage collector from writing to, and thereby copying, the preloaded objects
+    gc.freeze()
@@ -0,0 +1,3 @@
+from .metrics import Histogram, MetricsRegistry, registry, timed, record_stage
+from .middleware import TimingMiddleware
+from .profiler import SamplingProfiler, profiler
@@ -0,0 +1,100 @@
+import bisect
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Tuple
+
+# log-spaced upper bounds from 50µs to ~52s; counts beyond the last bound go to an overflow bucket
+SECONDS_BUCKETS = tuple(5e-5 * 2 ** i for i in range(21))
+QUANTILES = (0.5, 0.9, 0.99)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+class Histogram:
+    """Fixed-bucket histogram; quantiles are estimated as the upper bound of the bucket they fall in"""
+
+    def __init__(self, bounds: Tuple[float, ...] = SECONDS_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.bounds[i] if i < len(self.bounds) else self.max
+        return self.max
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'max': self.max,
+            **{f'p{round(q * 100)}': self.quantile(q) for q in QUANTILES},
+            'buckets': [[bound, count] for bound, count in zip(self.bounds + (float('inf'),), self.counts) if count],
+        }
+
+class MetricsRegistry:
+    """In-process histograms and counters keyed by name and labels, safe to update from any thread"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = defaultdict(dict)
+        self.counters: Dict[str, Dict[Labels, float]] = defaultdict(lambda: defaultdict(float))
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        key = tuple(sorted((label, str(v)) for label, v in labels.items()))
+        with self.lock:
+            histogram = self.histograms[name].get(key)
+            if histogram is None:
+                histogram = self.histograms[name][key] = Histogram()
+            histogram.observe(value)
+
+    def increment(self, name: str, amount: float = 1, **labels: Any) -> None:
+        key = tuple(sorted((label, str(v)) for label, v in labels.items()))
+        with self.lock:
+            self.counters[name][key] += amount
+
+    def snapshot(self) -> Dict[str, Dict[str, List[Dict[str, Any]]]]:
+        with self.lock:
+            return {
+                'histograms': {
+                    name: [{'labels': dict(key), **histogram.snapshot()} for key, histogram in series.items()]
+                    for name, series in self.histograms.items()
+                },
+                'counters': {
+                    name: [{'labels': dict(key), 'value': value} for key, value in series.items()]
+                    for name, series in self.counters.items()
+                },
+            }
+
+registry = MetricsRegistry()
+
+@contextmanager
+def timed(name: str, **labels: Any) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe(name, time.perf_counter() - start, **labels)
+
+def record_stage(storage: str, stage: str, seconds: float, rows_in: int, rows_out: int) -> None:
+    """One filter stage: its latency, and rows entering and surviving it (their ratio is the selectivity)"""
+    registry.observe('filter_stage_seconds', seconds, storage=storage, stage=stage)
+    registry.increment('filter_stage_rows_in', rows_in, storage=storage, stage=stage)
+    registry.increment('filter_stage_rows_out', rows_out, storage=storage, stage=stage)
@@ -0,0 +1,35 @@
+import time
+from .metrics import registry
+from .profiler import profiler
+
+class TimingMiddleware:
+    """
+    Records http_request_seconds per method, route template and status, and hands slow requests to the
+    sampling profiler. Plain ASGI so streamed responses are timed until their last chunk is sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            end = time.perf_counter()
+            # the route template rather than the raw path keeps label cardinality bounded
+            route = getattr(scope.get('route'), 'path', 'unmatched')
+            registry.observe('http_request_seconds', end - start, method=scope['method'], route=route, status=status)
+            profiler.record_request(f"{scope['method']} {scope['path']}", start, end)
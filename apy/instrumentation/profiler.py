@@ -0,0 +1,84 @@
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+SAMPLE_INTERVAL = 0.005
+RETENTION_SECONDS = 30.0
+MAX_PROFILES = 20
+MAX_DEPTH = 64
+
+def folded_stack(frame) -> str:
+    """Root-first 'file:function;...' frames, the folded format flamegraph tools read"""
+    names = []
+    while frame is not None and len(names) < MAX_DEPTH:
+        code = frame.f_code
+        names.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+class SamplingProfiler:
+    """
+    Samples the stacks of every other thread at a fixed interval while enabled and keeps the last
+    RETENTION_SECONDS of them. When a request runs longer than threshold seconds, the samples taken
+    during it are kept as that request's profile. Samples are not attributed per request, so under
+    concurrency a profile also contains whatever else ran at the same time.
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL, threshold: float = 0.5):
+        self.interval = interval
+        self.threshold = threshold
+        self.samples: Deque[Tuple[float, str]] = deque()
+        self.profiles: Deque[Dict[str, Any]] = deque(maxlen=MAX_PROFILES)
+        self.lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @property
+    def enabled(self) -> bool:
+        return self._thread is not None
+
+    def start(self, threshold: Optional[float] = None, interval: Optional[float] = None) -> None:
+        self.threshold = self.threshold if threshold is None else threshold
+        self.interval = self.interval if interval is None else interval
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        with self.lock:
+            self.samples.clear()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            stacks = [folded_stack(frame) for ident, frame in sys._current_frames().items() if ident != own]
+            with self.lock:
+                self.samples.extend((now, stack) for stack in stacks)
+                while self.samples and self.samples[0][0] < now - RETENTION_SECONDS:
+                    self.samples.popleft()
+
+    def record_request(self, name: str, start: float, end: float) -> None:
+        """Keep the samples between start and end (perf_counter) if the request was slow"""
+        if not self.enabled or end - start < self.threshold:
+            return
+        with self.lock:
+            stacks = Counter(stack for at, stack in self.samples if start <= at <= end)
+        self.profiles.append({
+            'request': name,
+            'duration_ms': (end - start) * 1000,
+            'samples': sum(stacks.values()),
+            'folded': [f"{stack} {count}" for stack, count in stacks.most_common()],
+        })
+
+    def recent_profiles(self) -> List[Dict[str, Any]]:
+        return list(self.profiles)
+
+profiler = SamplingProfiler()
@@ -1 +1,4 @@
-from .oai import openai_client_embedding_request, openai_client_chat_completion_request, openai_client_tool_completion_request
\ No newline at end of file
+from .oai import openai_client_embedding_request, openai_client_embeddings_request, openai_client_chat_completion_request, openai_client_tool_completion_request
+from .embeddings import EmbeddingCache, embed_texts
+from .cache import AsyncTTLCache
+from .client import EndpointLimiter, LLMMetrics, create_client, metrics as llm_metrics
\ No newline at end of file
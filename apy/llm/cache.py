@@ -0,0 +1,57 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+class AsyncTTLCache:
+    """
+    LRU cache of coroutine results with a TTL. Concurrent misses for the same key share one
+    in-flight call; failures are not cached.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.inflight: Dict[Hashable, asyncio.Future] = {}
+        self.hits = self.misses = 0
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return False, None
+        expires, value = entry
+        if expires <= time.monotonic():
+            del self.entries[key]
+            return False, None
+        self.entries.move_to_end(key)
+        return True, value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        self.entries[key] = (time.monotonic() + self.ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+    async def get_or_compute(self, key: Hashable, compute: Callable[[], Awaitable[Any]]) -> Any:
+        found, value = self.get(key)
+        if found:
+            self.hits += 1
+            return value
+
+        future = self.inflight.get(key)
+        if future is None:
+            self.misses += 1
+            future = asyncio.ensure_future(compute())
+            self.inflight[key] = future
+            future.add_done_callback(lambda done: self._settle(key, done))
+        # shield so one cancelled waiter does not cancel the call the others are waiting on
+        return await asyncio.shield(future)
+
+    def _settle(self, key: Hashable, future: asyncio.Future) -> None:
+        self.inflight.pop(key, None)
+        if not future.cancelled() and future.exception() is None:
+            self.put(key, future.result())
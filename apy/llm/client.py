@@ -0,0 +1,175 @@
+import asyncio
+import email.utils
+import os
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional
+import httpx
+import openai
+from openai import AsyncOpenAI
+from tenacity import RetryCallState, wait_random_exponential
+from instrumentation import registry
+
+ENDPOINT_DEFAULTS = {
+    # endpoint: (max concurrent requests, requests per minute)
+    'embeddings': (8, 3000),
+    'chat': (8, 500),
+    'tool': (16, 500),  # interactive /aifilter calls get their own budget so batch tagging cannot starve them
+}
+MAX_CONNECTIONS = int(os.getenv('LLM_MAX_CONNECTIONS', '64'))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('LLM_MAX_KEEPALIVE_CONNECTIONS', '32'))
+REQUEST_TIMEOUT = float(os.getenv('LLM_REQUEST_TIMEOUT', '60'))
+MAX_RETRY_AFTER = 120.0
+
+def create_client(**kwargs) -> AsyncOpenAI:
+    """
+    Shared client with a tuned connection pool. The SDK's own retries are off because retries happen
+    in our policy, which goes through the endpoint limiters. OPENAI_BASE_URL points it at a fake server.
+    """
+    kwargs.setdefault('max_retries', 0)
+    kwargs.setdefault('timeout', REQUEST_TIMEOUT)
+    kwargs.setdefault('http_client', openai.DefaultAsyncHttpxClient(
+        limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS)
+    ))
+    return AsyncOpenAI(**kwargs)
+
+class EndpointLimiter:
+    """
+    Caps in-flight requests with a semaphore and request rate with a token bucket; Retry-After pauses everyone.
+    The semaphore and lock are made inside the running loop and remade when a new loop (a later asyncio.run)
+    uses the limiter, since asyncio primitives cannot be shared across loops; the bucket and pause carry over.
+    """
+
+    def __init__(self, concurrency: int, requests_per_minute: float):
+        self.concurrency = concurrency
+        self.rate = requests_per_minute / 60.0
+        self.capacity = max(1.0, float(concurrency))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    def _bind(self) -> None:
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._lock = asyncio.Lock()
+
+    @classmethod
+    def from_env(cls, endpoint: str) -> 'EndpointLimiter':
+        concurrency, rpm = ENDPOINT_DEFAULTS[endpoint]
+        prefix = f'LLM_{endpoint.upper()}'
+        return cls(int(os.getenv(f'{prefix}_CONCURRENCY', concurrency)), float(os.getenv(f'{prefix}_RPM', rpm)))
+
+    def pause(self, seconds: float) -> None:
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def _take_token(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    @asynccontextmanager
+    async def slot(self):
+        self._bind()
+        async with self._semaphore:
+            await self._take_token()
+            yield
+
+class LLMMetrics:
+    """Per-endpoint call counts, retries, failures, latency and token usage"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self) -> None:
+        self.stats: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+
+    def record_call(self, endpoint: str, seconds: float, usage: Any = None, error: Optional[BaseException] = None) -> None:
+        registry.observe('llm_call_seconds', seconds, endpoint=endpoint, outcome='error' if error is not None else 'ok')
+        stats = self.stats[endpoint]
+        stats['calls'] += 1
+        stats['latency_seconds_total'] += seconds
+        stats['latency_seconds_max'] = max(stats['latency_seconds_max'], seconds)
+        if error is not None:
+            stats['errors'] += 1
+        for field in ('prompt_tokens', 'completion_tokens', 'total_tokens'):
+            tokens = getattr(usage, field, None) or 0
+            stats[field] += tokens
+            if tokens:
+                registry.increment('llm_tokens', tokens, endpoint=endpoint, kind=field)
+
+    def record_retry(self, endpoint: str) -> None:
+        registry.increment('llm_retries', endpoint=endpoint)
+        self.stats[endpoint]['retries'] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        return {endpoint: dict(stats) for endpoint, stats in self.stats.items()}
+
+def is_retryable(exception: BaseException) -> bool:
+    """Rate limits, timeouts, dropped connections and 5xx are worth retrying; 4xx request errors are not"""
+    if isinstance(exception, (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)):
+        return True
+    return isinstance(exception, openai.APIStatusError) and exception.status_code in (408, 409)
+
+def retry_after_seconds(exception: BaseException) -> Optional[float]:
+    response = getattr(exception, 'response', None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        if headers.get('retry-after'):
+            value = headers['retry-after']
+            try:
+                return float(value)
+            except ValueError:
+                return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+    return None
+
+_backoff = wait_random_exponential(multiplier=1, min=1, max=60)
+
+def wait_retry_after(retry_state: RetryCallState) -> float:
+    """Server-provided Retry-After when present, otherwise jittered exponential backoff"""
+    delay = retry_after_seconds(retry_state.outcome.exception())
+    return min(delay, MAX_RETRY_AFTER) if delay is not None else _backoff(retry_state)
+
+limiters: Dict[str, EndpointLimiter] = {}
+metrics = LLMMetrics()
+
+def get_limiter(endpoint: str) -> EndpointLimiter:
+    if endpoint not in limiters:
+        limiters[endpoint] = EndpointLimiter.from_env(endpoint)
+    return limiters[endpoint]
+
+async def limited_call(endpoint: str, request):
+    """Run one request attempt under the endpoint limiter, recording latency, usage and errors"""
+    limiter = get_limiter(endpoint)
+    async with limiter.slot():
+        start = time.perf_counter()
+        try:
+            response = await request()
+        except Exception as e:
+            metrics.record_call(endpoint, time.perf_counter() - start, error=e)
+            delay = retry_after_seconds(e)
+            if delay is not None:
+                limiter.pause(min(delay, MAX_RETRY_AFTER))
+            raise
+        metrics.record_call(endpoint, time.perf_counter() - start, getattr(response, 'usage', None))
+        return response
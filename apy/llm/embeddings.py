@@ -0,0 +1,93 @@
+import asyncio
+import hashlib
+import sqlite3
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence
+import numpy as np
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+MAX_BATCH_ITEMS = 2048      # API cap on inputs per embeddings request
+MAX_BATCH_TOKENS = 250_000  # kept under the 300k tokens-per-request cap
+CHARS_PER_TOKEN = 4         # rough estimate, avoids a tokenizer dependency
+MAX_CONCURRENCY = 4
+CACHE_PATH = 'db/embedding_cache.sqlite'
+SQLITE_MAX_PARAMS = 900
+
+EmbedBatch = Callable[[List[str], str], Awaitable[List[List[float]]]]
+
+def content_key(text: str, model: str) -> str:
+    return hashlib.sha256(f"{model}\0{text}".encode()).hexdigest()
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+class EmbeddingCache:
+    """float32 embeddings on disk keyed by a hash of model + text"""
+
+    def __init__(self, path: str = CACHE_PATH):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        keys = list(keys)
+        for start in range(0, len(keys), SQLITE_MAX_PARAMS):
+            chunk = keys[start:start + SQLITE_MAX_PARAMS]
+            rows = self.connection.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+            )
+            found.update((key, np.frombuffer(vector, dtype=np.float32)) for key, vector in rows)
+        return found
+
+    def put_many(self, vectors: Dict[str, np.ndarray]) -> None:
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in vectors.items()],
+            )
+
+    def close(self) -> None:
+        self.connection.close()
+
+def batch_texts(texts: Sequence[str], max_items: int = MAX_BATCH_ITEMS, max_tokens: int = MAX_BATCH_TOKENS) -> List[List[int]]:
+    """Greedily pack text indices into batches under both the item and token limits"""
+    batches, batch, tokens = [], [], 0
+    for i, text in enumerate(texts):
+        cost = estimate_tokens(text)
+        if batch and (len(batch) == max_items or tokens + cost > max_tokens):
+            batches.append(batch)
+            batch, tokens = [], 0
+        batch.append(i)
+        tokens += cost
+    if batch:
+        batches.append(batch)
+    return batches
+
+async def embed_texts(texts: Sequence[str], embed_batch: Optional[EmbedBatch] = None, cache: Optional[EmbeddingCache] = None,
+                      model: str = EMBEDDING_MODEL, max_concurrency: int = MAX_CONCURRENCY,
+                      max_items: int = MAX_BATCH_ITEMS, max_tokens: int = MAX_BATCH_TOKENS) -> np.ndarray:
+    """
+    Embed texts in packed batches with at most max_concurrency requests in flight.
+    Duplicate texts are embedded once, and with a cache only texts never seen before hit the API.
+    """
+    if embed_batch is None:
+        from .oai import openai_client_embeddings_request
+        embed_batch = openai_client_embeddings_request
+
+    texts = [text.replace("\n", " ") for text in texts]
+    keys = [content_key(text, model) for text in texts]
+    vectors = cache.get_many(set(keys)) if cache else {}
+
+    pending = list({key: text for key, text in zip(keys, texts) if key not in vectors}.items())
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(batch: List[int]):
+        async with semaphore:
+            embeddings = await embed_batch([pending[i][1] for i in batch], model)
+        fresh = {pending[i][0]: np.asarray(embedding, dtype=np.float32) for i, embedding in zip(batch, embeddings)}
+        vectors.update(fresh)
+        if cache:
+            # persisted per batch so an interrupted run keeps what it paid for
+            cache.put_many(fresh)
+
+    await asyncio.gather(*(run(batch) for batch in batch_texts([text for _, text in pending], max_items, max_tokens)))
+    return np.array([vectors[key] for key in keys], dtype=np.float64)
@@ -1,58 +1,69 @@
-from tenacity import retry, retry_if_exception_type, wait_random_exponential, stop_after_attempt
+import logging
+from tenacity import retry, retry_if_exception, stop_after_attempt
 import openai
-from openai import AsyncOpenAI
+from .client import create_client, is_retryable, limited_call, metrics, wait_retry_after
 
-client = AsyncOpenAI()
+logger = logging.getLogger(__name__)
 
-@retry(
-    wait=wait_random_exponential(multiplier=1, min=4, max=60),
-    retry=retry_if_exception_type((Exception)),
-    stop=stop_after_attempt(5),
-    before_sleep=lambda retry_state: print(f"Retrying attempt {retry_state.attempt_number} for OAI embedding request...")
-)
+client = create_client()
+
+def llm_retry(endpoint: str, description: str):
+    """Retry only retryable errors, honouring Retry-After; every attempt goes through the endpoint limiter"""
+    def before_sleep(retry_state):
+        metrics.record_retry(endpoint)
+        logger.warning("Retrying attempt %d for OAI %s request: %r", retry_state.attempt_number, description,
+                       retry_state.outcome.exception())
+
+    return retry(
+        wait=wait_retry_after,
+        retry=retry_if_exception(is_retryable),
+        stop=stop_after_attempt(5),
+        before_sleep=before_sleep
+    )
+
+@llm_retry('embeddings', 'embedding')
 async def openai_client_embedding_request(text, model="text-embedding-3-small"):
     text = text.replace("\n", " ")
     try:
-        response = await client.embeddings.create(input = [text], model=model)
+        response = await limited_call('embeddings', lambda: client.embeddings.create(input = [text], model=model))
         return response.data[0].embedding
     except openai.APIError as e:
-        print(f"OpenAI Embedding API Error: {e}")
+        logger.error("OpenAI Embedding API Error: %s", e)
+        raise
+
+@llm_retry('embeddings', 'batch embedding')
+async def openai_client_embeddings_request(texts, model="text-embedding-3-small"):
+    try:
+        response = await limited_call('embeddings', lambda: client.embeddings.create(input=texts, model=model))
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+    except openai.APIError as e:
+        logger.error("OpenAI Embedding API Error: %s", e)
         raise
 
-@retry(
-    wait=wait_random_exponential(multiplier=1, min=4, max=60),
-    retry=retry_if_exception_type((Exception)),
-    stop=stop_after_attempt(5),
-    before_sleep=lambda retry_state: print(f"Retrying attempt {retry_state.attempt_number} for OAI completion request...")
-)
+@llm_retry('chat', 'completion')
 async def openai_client_chat_completion_request(messages, model="gpt-4o", temperature=0.4, response_format="json_object"):
     try:
-        response = await client.chat.completions.create(
+        response = await limited_call('chat', lambda: client.chat.completions.create(
             model=model,
             messages=messages,
             response_format={ "type": response_format },
             temperature=temperature
-        )
+        ))
         return response
     except openai.APIError as e:
-        print(f"OpenAI API Error: {e}")
+        logger.error("OpenAI API Error: %s", e)
         raise
 
-@retry(
-    wait=wait_random_exponential(multiplier=1, min=4, max=60),
-    retry=retry_if_exception_type((Exception)),
-    stop=stop_after_attempt(5),
-    before_sleep=lambda retry_state: print(f"Retrying attempt {retry_state.attempt_number} for OAI tool completion request...")
-)
+@llm_retry('tool', 'tool completion')
 async def openai_client_tool_completion_request(messages, tools, tool_choice="auto", model="gpt-4o-2024-08-06"):
     try:
-        response = await client.chat.completions.create(
+        response = await limited_call('tool', lambda: client.chat.completions.create(
             model=model,
             messages=messages,
             tools=tools,
             tool_choice=tool_choice,
-        )
+        ))
         return response
     except openai.APIError as e:
-        print(f"OpenAI API Error: {e}")
-        raise
\ No newline at end of file
+        logger.error("OpenAI API Error: %s", e)
+        raise
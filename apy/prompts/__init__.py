@@ -1 +1 @@
-from .tag import tag_feedback_sys, tag_feedback_user
\ No newline at end of file
+from .tag import tag_feedback_sys, tag_feedback_user, tag_clusters_sys, tag_clusters_user
\ No newline at end of file
@@ -1,3 +1,15 @@
+tag_criteria = """Each tag must meet the following criteria:
+- **Specific**: The tag must clearly capture the main theme or issue in a way that makes it easy to identify similar tickets.
+- **Descriptive**: It should give enough context for the team to understand the category, type of feedback (bug, feature request, improvement), and the customer’s needs.
+- **Concise**: The tag should be short but meaningful, avoiding vague or overly general terms.
+
+These tags will be used to help the product team prioritize tickets based on the following aspects:
+- The **type of feedback** (e.g., bug, feature request, customer need)
+- **Impact areas** such as UI/UX, data processing, security, or integrations.
+
+Your tags should capture the core issues and opportunities in a way that helps us quickly filter and focus on what matters most.
+"""
+
 tag_feedback_sys = """You are an expert in tagging and categorizing feedback tickets. You will be provided with a group of feedback tickets, each containing a name, description, and other relevant details such as customer name, importance, and type. These tickets represent a mix of bug reports, feature requests, and product improvement suggestions.
 
 Your task is to generate an array of relevant and descriptive tags that accurately reflect the key themes, categories, and priorities within the group of feedback tickets. The goal of these tags is to help prioritize and categorize the tickets effectively, so the product team can focus on addressing the most critical areas for improvement.
@@ -8,19 +20,28 @@ Your output must be a JSON object with the following structure:
     "tags": Array of strings (e.g. ["Tag 1", "Tag 2", "Tag 3", ...])
 }}
 
-Each tag must meet the following criteria:
-- **Specific**: The tag must clearly capture the main theme or issue in a way that makes it easy to identify similar tickets.
-- **Descriptive**: It should give enough context for the team to understand the category, type of feedback (bug, feature request, improvement), and the customer’s needs.
-- **Concise**: The tag should be short but meaningful, avoiding vague or overly general terms.
+""" + tag_criteria
 
-These tags will be used to help the product team prioritize tickets based on the following aspects:
-- The **type of feedback** (e.g., bug, feature request, customer need)
-- **Impact areas** such as UI/UX, data processing, security, or integrations.
+tag_feedback_user = """Here are the feedback tickets:
 
-Your tags should capture the core issues and opportunities in a way that helps us quickly filter and focus on what matters most.
+{tickets}
 """
+tag_clusters_sys = """You are an expert in tagging and categorizing feedback tickets. You will be provided with several independent groups of feedback tickets. Each group is introduced by a header with its group id, and its tickets each contain a name and description. The tickets represent a mix of bug reports, feature requests, and product improvement suggestions.
 
-tag_feedback_user = """Here are the feedback tickets:
+For every group separately, generate an array of relevant and descriptive tags that accurately reflect the key themes, categories, and priorities within that group of feedback tickets. Tags for one group must only describe the tickets of that group. The goal of these tags is to help prioritize and categorize the tickets effectively, so the product team can focus on addressing the most critical areas for improvement.
 
-{tickets}
-"""
\ No newline at end of file
+Your output must be a JSON object with the following structure, containing exactly one entry per group:
+
+{
+    "groups": [
+        {"group": "<group id>", "tags": Array of strings (e.g. ["Tag 1", "Tag 2", "Tag 3", ...])},
+        ...
+    ]
+}
+
+""" + tag_criteria
+
+tag_clusters_user = """Here are the groups of feedback tickets:
+
+{groups}
+"""
@@ -0,0 +1,197 @@
+import os
+
+# stubbed LLM: the harness never needs OpenAI, and anything that tries fails fast against a closed local port
+os.environ['OPENAI_API_KEY'] = 'benchmark'
+os.environ['OPENAI_BASE_URL'] = 'http://127.0.0.1:9/v1'
+
+import argparse
+import asyncio
+import contextlib
+import functools
+import io
+import json
+import platform
+import sys
+import tempfile
+from typing import Any, Dict, List
+import numpy as np
+import sklearn
+import llm
+from benchmarks import BenchmarkResult, fake_embed_batch, format_results, measure, measure_async, random_embeddings, write_dataset
+from clustering.clusters import METHODS, SEARCH_STRATEGIES, cluster_vectors, perform_clustering
+from db import PseudoDB
+from db.snapshot import SNAPSHOT_PATH, build_snapshot
+
+SUITES = ('load', 'filters', 'api', 'embeddings', 'clustering')
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark PseudoDB, the API and the clustering pipeline on synthetic data")
+    parser.add_argument('--rows', type=int, default=10_000, help="synthetic feedback rows (10k-1M)")
+    parser.add_argument('--clusters', type=int, default=200, help="synthetic tagged clusters")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--suites', nargs='+', choices=SUITES, default=list(SUITES))
+    parser.add_argument('--storage', nargs='+', choices=('rows', 'columnar'), default=['rows', 'columnar'])
+    parser.add_argument('--iterations', type=int, default=20, help="timed iterations per filter/API benchmark")
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--cluster-rows', type=int, default=2000, help="random embeddings clustered per run")
+    parser.add_argument('--dim', type=int, default=64, help="dimension of the random embeddings")
+    parser.add_argument('--methods', nargs='+', choices=METHODS, default=list(METHODS))
+    parser.add_argument('--search', choices=SEARCH_STRATEGIES, default='auto')
+    parser.add_argument('--max-clusters', type=int, default=100)
+    parser.add_argument('--cluster-iterations', type=int, default=1)
+    parser.add_argument('--output', help="write results as JSON to this file")
+    parser.add_argument('--compare', help="JSON results of an earlier run to compare p50 latency against")
+    return parser.parse_args()
+
+def filter_mixes(records: List[Dict[str, Any]], clusters: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    by_size = sorted(clusters.values(), key=lambda cluster: len(cluster['ids']))
+    return {
+        'customer': {'customer': ['Loom']},
+        'customer+importance': {'customer': ['Loom', 'Ramp'], 'importance': ['High']},
+        'tag (large cluster)': {'tags': [by_size[-1]['tags'][0]]},
+        'tag (small cluster)': {'tags': [by_size[0]['tags'][0]]},
+        'date': {'date': records[0]['date'][:10]},
+        'importance_score range': {'importance_score': [2.0, 3.0]},
+        'name substring': {'name': 'csv'},
+        'description tokens': {'description': 'slow datas', 'text_match': 'tokens'},
+        'combined': {'customer': ['Notion'], 'type': ['Sales'], 'customer_impact': [2, 7], 'description': 'users'},
+    }
+
+def bench_load(args: argparse.Namespace) -> List[BenchmarkResult]:
+    results = [
+        measure(f"load[{storage}, json]", lambda storage=storage: PseudoDB(storage=storage, snapshot_path=None),
+                iterations=3, warmup=0)
+        for storage in args.storage
+    ]
+    build_snapshot()
+    results.append(measure("load[columnar, snapshot]", lambda: PseudoDB(storage='columnar', snapshot_path=SNAPSHOT_PATH),
+                           iterations=3, warmup=0))
+    return results
+
+def bench_filters(args: argparse.Namespace, mixes: Dict[str, Dict[str, Any]]) -> List[BenchmarkResult]:
+    results = []
+    for storage in args.storage:
+        db = PseudoDB(storage=storage, snapshot_path=None)
+        for name, filters in mixes.items():
+            results.append(measure(f"filter_feedback[{storage}] {name}", lambda: db.filter_feedback(filters),
+                                   args.iterations, args.warmup))
+        results.append(measure(f"filter_rows[{storage}] all mixes", lambda: [db.filter_rows(f) for f in mixes.values()],
+                               args.iterations, args.warmup))
+    return results
+
+async def bench_api(args: argparse.Namespace, mixes: Dict[str, Dict[str, Any]]) -> List[BenchmarkResult]:
+    import httpx
+    from app import app
+    from db import shared_store
+
+    results = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://benchmark') as client:
+        for storage in args.storage:
+            shared_store.factory = functools.partial(PseudoDB, storage=storage, snapshot_path=None)
+            shared_store.reload()
+            etag = (await client.get('/tags')).headers['etag']
+
+            async def post(path: str, body: Dict[str, Any]):
+                response = await client.post(path, json=body)
+                response.raise_for_status()
+                return response.content
+
+            async def get_tags(headers: Dict[str, str]):
+                return (await client.get('/tags', headers=headers)).content
+
+            calls = {
+                'POST /groups customer': lambda: post('/groups', {'filters': mixes['customer']}),
+                'POST /groups combined': lambda: post('/groups', {'filters': mixes['combined']}),
+                'POST /groups limit=100': lambda: post('/groups', {'limit': 100}),
+                'POST /groups/stream limit=1000': lambda: post('/groups/stream', {'limit': 1000}),
+                'GET /tags': lambda: get_tags({}),
+                'GET /tags (304)': lambda: get_tags({'If-None-Match': etag}),
+            }
+            for name, call in calls.items():
+                results.append(await measure_async(f"api[{storage}] {name}", call, args.iterations, args.warmup))
+    return results
+
+async def bench_embeddings(args: argparse.Namespace, records: List[Dict[str, Any]]) -> List[BenchmarkResult]:
+    texts = [record['description'] for record in records]
+    embed_batch = fake_embed_batch(args.dim)
+    cache = llm.EmbeddingCache('embedding_cache.sqlite')
+    try:
+        await llm.embed_texts(texts, embed_batch=embed_batch, cache=cache)
+        return [
+            await measure_async("embed_texts (stub, no cache)", lambda: llm.embed_texts(texts, embed_batch=embed_batch),
+                                iterations=3, warmup=1),
+            await measure_async("embed_texts (stub, warm cache)", lambda: llm.embed_texts(texts, embed_batch=embed_batch, cache=cache),
+                                iterations=3, warmup=1),
+        ]
+    finally:
+        cache.close()
+
+def bench_clustering(args: argparse.Namespace) -> List[BenchmarkResult]:
+    names = random_embeddings(args.cluster_rows, args.dim, seed=args.seed)
+    descriptions = random_embeddings(args.cluster_rows, args.dim, seed=args.seed + 1)
+    options = {'search': args.search, 'max_clusters': args.max_clusters}
+    results = [
+        measure(f"cluster_vectors[{method}] n={args.cluster_rows}",
+                lambda method=method: cluster_vectors(descriptions, method, **options),
+                args.cluster_iterations, warmup=0)
+        for method in args.methods
+    ]
+    results.append(measure(f"perform_clustering[kmeans, agglomerative] n={args.cluster_rows}",
+                           lambda: perform_clustering(names, descriptions, **options),
+                           args.cluster_iterations, warmup=0))
+    return results
+
+def environment() -> Dict[str, Any]:
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'scikit-learn': sklearn.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+def main(args: argparse.Namespace):
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = {result['name']: result for result in json.load(f)['results']}
+
+    cwd = os.getcwd()
+    results: List[BenchmarkResult] = []
+    with tempfile.TemporaryDirectory() as directory:
+        # PseudoDB and the app read db/... relative to the working directory
+        os.chdir(directory)
+        try:
+            print(f"Generating {args.rows} rows in {args.clusters} clusters (seed {args.seed})", file=sys.stderr)
+            clusters = write_dataset(directory, args.rows, args.clusters, args.seed)
+            with open('db/data.json') as f:
+                records = json.load(f)
+            mixes = filter_mixes(records, clusters)
+
+            # the app and clustering code print progress; keep it out of the report
+            with contextlib.redirect_stdout(io.StringIO()):
+                if 'load' in args.suites:
+                    results += bench_load(args)
+                if 'filters' in args.suites:
+                    results += bench_filters(args, mixes)
+                if 'api' in args.suites:
+                    results += asyncio.run(bench_api(args, mixes))
+                if 'embeddings' in args.suites:
+                    results += asyncio.run(bench_embeddings(args, records))
+                if 'clustering' in args.suites:
+                    results += bench_clustering(args)
+        finally:
+            os.chdir(cwd)
+
+    print(format_results(results, baseline))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'config': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+                'environment': environment(),
+                'results': [result._asdict() for result in results],
+            }, f, indent=2)
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -1,13 +1,86 @@
+import argparse
 import asyncio
+import numpy as np
 import utils
+from clustering.clusters import LARGE_SCALE_OPTIONS, METHODS, REDUCTIONS, SEARCH_STRATEGIES
+from clustering.incremental import CENTROIDS_PATH, centroids_from_labels, load_centroids, save_centroids
+from clustering.pipeline import CHECKPOINT_PATH
+from db.snapshot import build_snapshot
+from db.vectors import EMBEDDINGS_PATH, save_embeddings
 from schemas import Feedback
 
-async def main():
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Embed, cluster and tag db/data.json")
+    parser.add_argument('--large', action='store_true', help="large-scale preset: minibatch k-means + kNN-graph agglomerative on float32 PCA embeddings")
+    parser.add_argument('--methods', nargs='+', choices=METHODS, help="clustering methods to compare")
+    parser.add_argument('--float32', action='store_true', help="cluster float32 embeddings")
+    parser.add_argument('--reduce', choices=REDUCTIONS, help="dimensionality reduction before clustering")
+    parser.add_argument('--components', type=int, help="dimensions kept by --reduce")
+    parser.add_argument('--search', choices=SEARCH_STRATEGIES, help="cluster-count search strategy")
+    parser.add_argument('--sample-size', type=int, help="score silhouettes on a random sample of this size")
+    parser.add_argument('--patience', type=int, help="stop a cluster-count search once this many counts in a row fail to improve the score")
+    parser.add_argument('--max-clusters', type=int, help="upper bound of the cluster-count search")
+    parser.add_argument('--jobs', type=int, help="workers for clustering fits, scores and kNN graphs, shared by all searches (default: one per core)")
+    parser.add_argument('--checkpoint', nargs='?', const=CHECKPOINT_PATH,
+                        help=f"save clustering search progress to this file (default {CHECKPOINT_PATH}) and resume from it")
+    parser.add_argument('--incremental', action='store_true', help="only embed and assign feedback missing from the existing clusters")
+    parser.add_argument('--retag-threshold', type=float, default=utils.RETAG_THRESHOLD,
+                        help="re-tag a cluster in incremental mode once it grows by more than this fraction")
+    return parser.parse_args()
+
+def clustering_options(args: argparse.Namespace) -> dict:
+    options = dict(LARGE_SCALE_OPTIONS) if args.large else {}
+    overrides = {
+        'methods': args.methods,
+        'dtype': np.float32 if args.float32 else None,
+        'reduce': args.reduce,
+        'n_components': args.components,
+        'search': args.search,
+        'sample_size': args.sample_size,
+        'max_clusters': args.max_clusters,
+        'patience': args.patience,
+        'n_jobs': args.jobs,
+        'checkpoint': args.checkpoint,
+    }
+    options.update({key: value for key, value in overrides.items() if value is not None})
+    return options
+
+async def run_incremental(args: argparse.Namespace) -> bool:
+    centroids = load_centroids()
+    if centroids is None:
+        print(f"No centroids at {CENTROIDS_PATH}, running a full clustering instead")
+        return False
+
+    data = utils.load_json('db/data.json')
+    tagged_clusters = utils.load_json('db/updated_tagged_clusters.json')
+
+    tagged_clusters, centroids, touched = await utils.cluster_new_feedback(data, tagged_clusters, centroids, args.retag_threshold)
+    if not touched:
+        print("No new feedback to cluster")
+        return True
+
+    utils.save_json(tagged_clusters, 'db/updated_tagged_clusters.json')
+    save_centroids(*centroids)
+    added = await utils.store_new_embeddings(data)
+    print(f"Stored embeddings for {added} new feedback items in {EMBEDDINGS_PATH}")
+
+    print(f"Incremental clustering complete! Updated {len(touched)} clusters in db/updated_tagged_clusters.json")
+
+    print(f"Snapshot written to {build_snapshot()}")
+    return True
+
+async def main(args: argparse.Namespace):
+    if args.incremental and await run_incremental(args):
+        return
+
     data = utils.load_json('db/data.json')
 
     feedback_data = [Feedback(**item) for item in data]
 
-    _, _, name_labels, desc_labels = await utils.process_embeddings(feedback_data)
+    name_embeddings, desc_embeddings, name_labels, desc_labels = await utils.process_embeddings(feedback_data, **clustering_options(args))
+
+    save_centroids(*centroids_from_labels(desc_embeddings, desc_labels))
+    save_embeddings([item.id for item in feedback_data], {'name': name_embeddings, 'description': desc_embeddings})
 
     cluster_data = {
         str(item['id']): {
@@ -17,7 +90,7 @@ async def main():
         for i, item in enumerate(data)
     }
 
-    tagged_clusters = await utils.label_clusters(data, cluster_data)
+    tagged_clusters = await utils.label_clusters(data, cluster_data, desc_embeddings)
 
     updated_tagged_clusters = utils.update_tagged_clusters(data, tagged_clusters)
 
@@ -25,5 +98,7 @@ async def main():
 
     print("Clustering and tagging complete! Results saved to db/updated_tagged_clusters.json")
 
+    print(f"Snapshot written to {build_snapshot()}")
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    asyncio.run(main(parse_args()))
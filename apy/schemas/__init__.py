@@ -1 +1 @@
-from .feedback import Feedback, Tag, TaggedClusters, FeedbackResponse, FilterParams
\ No newline at end of file
+from .feedback import Feedback, Tag, TaggedClusters, FeedbackResponse, TagsResponse, ClusterSummary, FacetsResponse, TrendsResponse, FilterParams
\ No newline at end of file
@@ -1,5 +1,5 @@
-from pydantic import BaseModel, RootModel
-from typing import Dict, List, Optional
+from pydantic import BaseModel, RootModel, field_validator
+from typing import Dict, List, Literal, Optional
 from datetime import datetime
 
 class Feedback(BaseModel):
@@ -24,6 +24,34 @@ class FeedbackResponse(BaseModel):
     feedback: List[Feedback]
     tagged_clusters: TaggedClusters
 
+class TagsResponse(BaseModel):
+    tags: List[str]
+    importance_score_range: Dict[str, float]
+    customer_impact_range: Dict[str, int]
+
+class ClusterSummary(BaseModel):
+    count: int
+    importance_score: float
+    customer_impact: int
+
+class FacetsResponse(BaseModel):
+    total: int
+    importance: Dict[str, int]
+    type: Dict[str, int]
+    customer: Dict[str, int]
+    tags: Dict[str, int]
+    date: Dict[str, int]
+    clusters: Dict[str, ClusterSummary]
+    importance_score_range: Dict[str, float]
+    customer_impact_range: Dict[str, int]
+
+class TrendsResponse(BaseModel):
+    dimension: str
+    bucket: str
+    buckets: List[str]
+    total: List[int]
+    series: Dict[str, List[int]]
+
 class FilterParams(BaseModel):
     name: Optional[str] = None
     description: Optional[str] = None
@@ -31,6 +59,19 @@ class FilterParams(BaseModel):
     type: Optional[List[str]] = None
     customer: Optional[List[str]] = None
     date: Optional[str] = None
+    # inclusive ISO day range; combines with date when both are set
+    date_from: Optional[str] = None
+    date_to: Optional[str] = None
     tags: Optional[List[str]] = None
     importance_score: Optional[List[float]] = None
     customer_impact: Optional[List[int]] = None
+    # how name/description match: 'substring', or 'tokens', which also ranks by relevance; unset uses the server default
+    text_match: Optional[Literal['substring', 'tokens']] = None
+
+    @field_validator('date', 'date_from', 'date_to')
+    @classmethod
+    def check_iso_date(cls, value: Optional[str]) -> Optional[str]:
+        """Kept as the string the filters compare against, but rejected up front unless it parses as ISO"""
+        if value:
+            datetime.fromisoformat(value)
+        return value
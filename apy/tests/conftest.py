@@ -0,0 +1,72 @@
+import os
+
+# llm.oai builds its client at import; tests never reach the real API
+os.environ.setdefault('OPENAI_API_KEY', 'test')
+
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+class FakeOpenAI:
+    """
+    Local stand-in for the OpenAI API. Responses are served from a script of (status, headers) pairs;
+    once it runs out every request succeeds. Only /embeddings bodies are modelled.
+    """
+
+    def __init__(self):
+        self.script = deque()
+        self.delay = 0.0
+        self.requests = 0
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                with fake.lock:
+                    fake.requests += 1
+                    fake.active += 1
+                    fake.max_active = max(fake.max_active, fake.active)
+                    status, headers = fake.script.popleft() if fake.script else (200, {})
+                time.sleep(fake.delay)
+                if status == 200:
+                    inputs = body['input'] if isinstance(body['input'], list) else [body['input']]
+                    payload = {
+                        'object': 'list',
+                        'data': [{'object': 'embedding', 'index': i, 'embedding': [float(len(text)), 1.0]} for i, text in enumerate(inputs)],
+                        'model': body['model'],
+                        'usage': {'prompt_tokens': len(inputs), 'total_tokens': len(inputs)},
+                    }
+                else:
+                    payload = {'error': {'message': f'scripted {status}', 'type': 'scripted', 'code': None}}
+                encoded = json.dumps(payload).encode()
+                with fake.lock:
+                    fake.active -= 1
+                self.send_response(status)
+                for name, value in {'Content-Type': 'application/json', **headers}.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(encoded)))
+                self.end_headers()
+                self.wfile.write(encoded)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def fake_openai():
+    fake = FakeOpenAI()
+    yield fake
+    fake.close()
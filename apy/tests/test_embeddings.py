@@ -0,0 +1,80 @@
+import asyncio
+import numpy as np
+from llm.embeddings import EmbeddingCache, batch_texts, content_key, embed_texts, estimate_tokens
+
+DIM = 8
+
+class StubEmbedder:
+    """Deterministic stand-in for openai_client_embeddings_request that records its batches"""
+
+    def __init__(self, delay: float = 0.0):
+        self.batches = []
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def __call__(self, texts, model):
+        self.batches.append(list(texts))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(self.delay)
+        self.in_flight -= 1
+        return [vector(text).tolist() for text in texts]
+
+def vector(text: str) -> np.ndarray:
+    seed = int(content_key(text, 'stub')[:8], 16)
+    return np.random.default_rng(seed).normal(size=DIM).astype(np.float32)
+
+def test_batch_texts_respects_item_and_token_limits():
+    texts = ['x' * 40] * 10  # 11 estimated tokens each
+    batches = batch_texts(texts, max_items=4, max_tokens=30)
+    assert [i for batch in batches for i in batch] == list(range(10))
+    assert all(len(batch) <= 4 for batch in batches)
+    assert all(sum(estimate_tokens(texts[i]) for i in batch) <= 30 for batch in batches)
+
+def test_batch_texts_keeps_oversized_text_in_its_own_batch():
+    assert batch_texts(['a', 'b' * 400, 'c'], max_items=10, max_tokens=20) == [[0], [1], [2]]
+
+def test_embed_texts_packs_batches_and_preserves_order():
+    stub = StubEmbedder()
+    texts = [f"feedback {i}" for i in range(25)]
+    result = asyncio.run(embed_texts(texts, stub, max_items=10))
+    assert [len(batch) for batch in stub.batches] == [10, 10, 5]
+    assert result.shape == (25, DIM)
+    np.testing.assert_allclose(result, np.array([vector(text) for text in texts]))
+
+def test_embed_texts_embeds_duplicates_once():
+    stub = StubEmbedder()
+    result = asyncio.run(embed_texts(['same', 'other', 'same'], stub))
+    assert sorted(text for batch in stub.batches for text in batch) == ['other', 'same']
+    np.testing.assert_array_equal(result[0], result[2])
+
+def test_embed_texts_bounds_concurrency():
+    stub = StubEmbedder(delay=0.01)
+    asyncio.run(embed_texts([f"t{i}" for i in range(20)], stub, max_items=1, max_concurrency=3))
+    assert len(stub.batches) == 20
+    assert stub.max_in_flight == 3
+
+def test_cache_skips_unchanged_texts_across_runs(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    texts = ['alpha', 'beta', 'gamma']
+
+    cache = EmbeddingCache(path)
+    first = asyncio.run(embed_texts(texts, StubEmbedder(), cache))
+    cache.close()
+
+    stub = StubEmbedder()
+    cache = EmbeddingCache(path)
+    second = asyncio.run(embed_texts(texts + ['delta'], stub, cache))
+    cache.close()
+
+    assert stub.batches == [['delta']]
+    np.testing.assert_allclose(second[:3], first)
+
+def test_cache_is_keyed_by_model(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / 'cache.sqlite'))
+    asyncio.run(embed_texts(['alpha'], StubEmbedder(), cache, model='model-a'))
+    stub = StubEmbedder()
+    asyncio.run(embed_texts(['alpha'], stub, cache, model='model-b'))
+    cache.close()
+    assert stub.batches == [['alpha']]
@@ -0,0 +1,114 @@
+import asyncio
+import time
+import httpx
+import openai
+import pytest
+from tenacity import RetryError
+import llm.client
+import llm.oai
+from llm.client import EndpointLimiter, create_client, metrics, retry_after_seconds
+
+@pytest.fixture
+def client(fake_openai, monkeypatch):
+    """Point llm.oai at the fake server with fresh limiters and metrics"""
+    monkeypatch.setattr(llm.oai, 'client', create_client(api_key='test', base_url=fake_openai.base_url))
+    monkeypatch.setattr(llm.client, 'limiters', {})
+    metrics.reset()
+    return fake_openai
+
+def embed(texts):
+    return asyncio.run(llm.oai.openai_client_embeddings_request(texts))
+
+def test_embeddings_round_trip(client):
+    assert embed(['a', 'bbb']) == [[1.0, 1.0], [3.0, 1.0]]
+    stats = metrics.snapshot()['embeddings']
+    assert stats['calls'] == 1 and stats['prompt_tokens'] == 2 and stats.get('retries', 0) == 0
+
+def test_rate_limit_is_retried_after_retry_after(client):
+    client.script.append((429, {'retry-after-ms': '200'}))
+    start = time.perf_counter()
+    assert embed(['a']) == [[1.0, 1.0]]
+    assert time.perf_counter() - start >= 0.2
+    assert client.requests == 2
+    stats = metrics.snapshot()['embeddings']
+    assert stats['retries'] == 1 and stats['errors'] == 1
+
+def test_server_errors_are_retried(client):
+    client.script.extend([(500, {'retry-after-ms': '10'}), (503, {'retry-after-ms': '10'})])
+    assert embed(['a']) == [[1.0, 1.0]]
+    assert client.requests == 3
+
+def test_client_errors_are_not_retried(client):
+    client.script.append((400, {}))
+    with pytest.raises(openai.BadRequestError):
+        embed(['a'])
+    assert client.requests == 1
+    assert metrics.snapshot()['embeddings'].get('retries', 0) == 0
+
+def test_retries_give_up_after_five_attempts(client):
+    client.script.extend([(429, {'retry-after-ms': '1'})] * 5)
+    with pytest.raises(RetryError):
+        embed(['a'])
+    assert client.requests == 5
+
+def test_limiter_caps_requests_in_flight(client, monkeypatch):
+    monkeypatch.setattr(llm.client, 'limiters', {'embeddings': EndpointLimiter(concurrency=2, requests_per_minute=60_000)})
+    client.delay = 0.05
+
+    async def run():
+        return await asyncio.gather(*(llm.oai.openai_client_embeddings_request([str(i)]) for i in range(8)))
+
+    assert len(asyncio.run(run())) == 8
+    assert client.max_active == 2
+
+def test_retry_after_pauses_the_whole_endpoint(client):
+    client.script.append((429, {'retry-after': '1'}))
+
+    async def run():
+        first = asyncio.ensure_future(llm.oai.openai_client_embeddings_request(['a']))
+        await asyncio.sleep(0.1)  # the 429 has paused the endpoint by now
+        start = time.perf_counter()
+        await llm.oai.openai_client_embeddings_request(['b'])
+        waited = time.perf_counter() - start
+        await first
+        return waited
+
+    # the second caller never saw the 429 but still waited out the pause it set
+    assert asyncio.run(run()) >= 0.8
+    assert client.requests == 3
+
+def test_limiter_can_be_reused_across_event_loops():
+    limiter = EndpointLimiter(concurrency=1, requests_per_minute=60_000)
+
+    async def contend():
+        async def hold():
+            async with limiter.slot():
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(hold(), hold())
+
+    # each asyncio.run is a new loop, as with one CLI command per run
+    asyncio.run(contend())
+    asyncio.run(contend())
+
+def test_token_bucket_spaces_requests():
+    limiter = EndpointLimiter(concurrency=1, requests_per_minute=600)
+
+    async def run():
+        for _ in range(4):
+            async with limiter.slot():
+                pass
+
+    start = time.perf_counter()
+    asyncio.run(run())
+    # the first request uses the single burst token, the next three wait 0.1s each
+    assert time.perf_counter() - start >= 0.29
+
+def test_retry_after_header_formats():
+    def error(headers):
+        return openai.RateLimitError('limited', response=httpx.Response(429, headers=headers, request=httpx.Request('POST', 'http://x')), body=None)
+
+    assert retry_after_seconds(error({'retry-after-ms': '1500'})) == 1.5
+    assert retry_after_seconds(error({'retry-after': '3'})) == 3.0
+    assert retry_after_seconds(error({})) is None
+    assert retry_after_seconds(ValueError()) is None
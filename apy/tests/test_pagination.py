@@ -0,0 +1,36 @@
+import pytest
+from db.pagination import encode_cursor, paginate
+
+class Table:
+    """Row position <-> feedback id lookups as FeedbackIndex and ColumnarStore provide them"""
+
+    def __init__(self, ids):
+        self.ids = ids
+
+    def row_of(self, feedback_id):
+        return self.ids.index(feedback_id) if feedback_id in self.ids else None
+
+    def id_at(self, row):
+        return self.ids[row]
+
+def test_cursor_walks_every_row_once():
+    table = Table([10, 11, 12, 13, 14])
+    rows, cursor, seen = [0, 2, 3, 4], None, []
+    while True:
+        page, cursor = paginate(rows, 2, cursor, table)
+        seen.extend(page)
+        if cursor is None:
+            break
+    assert seen == rows
+
+def test_cursor_survives_a_reload_that_shifts_rows():
+    page, cursor = paginate([0, 1, 2, 3], 2, None, Table([10, 11, 12, 13]))
+    assert page == [0, 1]
+    # a reload inserted feedback 9 at the front, moving every row down by one
+    reloaded = Table([9, 10, 11, 12, 13])
+    page, _ = paginate([0, 1, 2, 3, 4], 2, cursor, reloaded)
+    assert [reloaded.id_at(row) for row in page] == [12, 13]
+
+def test_cursor_for_removed_feedback_is_rejected():
+    with pytest.raises(ValueError):
+        paginate([0, 1], 1, encode_cursor(11), Table([10, 12]))
@@ -0,0 +1,40 @@
+from utils.query_parser import LocalFilterParser
+
+def filter_tools(**enums):
+    properties = {field: {'type': 'array', 'items': {'type': 'string', 'enum': values}} for field, values in enums.items()}
+    return [{'type': 'function', 'function': {'name': 'filter_data', 'parameters': {'type': 'object', 'properties': properties}}}]
+
+PARSER = LocalFilterParser(filter_tools(
+    customer=['Loom', 'Ramp'],
+    importance=['High', 'Medium', 'Low'],
+    type=['Bug', 'Feature Request', 'Customer'],
+    tags=['Performance'],
+))
+
+def test_single_value_resolves_fully():
+    filters, confidence = PARSER.parse('Loom')
+    assert filters.customer == ['Loom']
+    assert confidence == 1.0
+
+def test_value_inside_a_sentence_ignores_stopwords():
+    filters, confidence = PARSER.parse('show me Ramp feedback')
+    assert filters.customer == ['Ramp']
+    assert confidence == 1.0
+
+    filters, confidence = PARSER.parse('high priority bugs from Loom on 2024-03-01')
+    assert (filters.importance, filters.type, filters.customer, filters.date) == (['High'], ['Bug'], ['Loom'], '2024-03-01')
+    assert confidence == 1.0
+
+def test_invalid_date_stays_unresolved():
+    filters, confidence = PARSER.parse('Loom feedback from 2024-13-45')
+    assert filters.customer == ['Loom']
+    assert filters.date is None
+    assert confidence < 1.0
+
+def test_ambiguous_or_unknown_words_go_to_the_llm():
+    # 'customer' is both a type and a generic word
+    assert PARSER.parse('customer feedback')[1] == 0.0
+    filters, confidence = PARSER.parse('Loom complaints about onboarding')
+    assert filters.customer == ['Loom']
+    assert confidence < 1.0
+    assert PARSER.parse('2024-03-01 or 2024-03-02')[1] == 0.0
@@ -1,12 +1,18 @@
-from .llm_tools import filter_data_tool
+from .llm_tools import FilterTool, build_filter_tool, create_filter_data_tool, get_filter_data_tool, get_filter_tool
+from .query_parser import LocalFilterParser
 from .tools import (
+    RETAG_THRESHOLD,
     load_json,
     save_json,
     calculate_importance_score,
     calculate_customer_impact,
+    cluster_statistics,
     update_tagged_clusters,
     get_embeddings,
     process_embeddings,
+    store_new_embeddings,
     tag_cluster,
-    label_clusters
+    tag_clusters,
+    label_clusters,
+    cluster_new_feedback
 )
\ No newline at end of file
@@ -1,8 +1,9 @@
-from typing import Dict, Any, List, Set
+import hashlib
+import json
+from typing import Dict, Any, List, NamedTuple, Set
 from schemas import TaggedClusters
-from db import PseudoDB
-
-pseudo_db = PseudoDB()
+from db import PseudoDB, shared_store
+from .query_parser import LocalFilterParser
 
 def get_all_tags(tagged_clusters: TaggedClusters) -> List[str]:
     all_tags: Set[str] = set()
@@ -52,6 +53,16 @@ def create_filter_data_tool(pseudo_db: PseudoDB) -> Dict[str, Any]:
                         "format": "date",
                         "description": "Filter by specific date (ISO format: YYYY-MM-DD)."
                     },
+                    "date_from": {
+                        "type": "string",
+                        "format": "date",
+                        "description": "Only feedback on or after this date (ISO format: YYYY-MM-DD)."
+                    },
+                    "date_to": {
+                        "type": "string",
+                        "format": "date",
+                        "description": "Only feedback on or before this date (ISO format: YYYY-MM-DD)."
+                    },
                     "importance_score": {
                         "type": "array",
                         "items": {
@@ -89,4 +100,22 @@ def create_filter_data_tool(pseudo_db: PseudoDB) -> Dict[str, Any]:
     }
     ]
 
-filter_data_tool = create_filter_data_tool(pseudo_db)
\ No newline at end of file
+class FilterTool(NamedTuple):
+    """The filter_data tool schema plus what /aifilter derives from it"""
+    tools: List[Dict[str, Any]]
+    schema_hash: str
+    parser: LocalFilterParser
+
+def build_filter_tool(pseudo_db: PseudoDB) -> FilterTool:
+    tools = create_filter_data_tool(pseudo_db)
+    schema_hash = hashlib.sha256(json.dumps(tools, sort_keys=True).encode()).hexdigest()
+    return FilterTool(tools, schema_hash, LocalFilterParser(tools))
+
+# rebuilt together with every (re)load of the shared store, so the tag enum always matches the served data
+shared_store.derive('filter_tool', build_filter_tool)
+
+def get_filter_tool() -> FilterTool:
+    return shared_store.get_derived('filter_tool')
+
+def get_filter_data_tool() -> List[Dict[str, Any]]:
+    return get_filter_tool().tools
@@ -0,0 +1,106 @@
+import re
+from collections import defaultdict
+from datetime import date
+from typing import Any, Dict, List, Set, Tuple
+from schemas import FilterParams
+
+ENUM_FIELDS = ('importance', 'type', 'customer', 'tags')
+
+ALIASES: Dict[str, Dict[str, List[str]]] = {
+    'importance': {
+        'High': ['high priority', 'high importance', 'urgent', 'critical', 'important'],
+        'Medium': ['medium priority', 'medium importance', 'normal priority'],
+        'Low': ['low priority', 'low importance', 'minor'],
+    },
+}
+
+# words that carry no filter meaning on their own
+STOPWORDS = {
+    'a', 'all', 'an', 'and', 'any', 'are', 'by', 'every', 'feedback', 'filter', 'find', 'for', 'from', 'get',
+    'give', 'in', 'is', 'item', 'items', 'list', 'me', 'of', 'on', 'or', 'please', 'show', 'that', 'the',
+    'ticket', 'tickets', 'to', 'which', 'with', 'about', 'related', 'regarding', 'level', 'tagged', 'tag', 'tags',
+    'priority', 'importance', 'type', 'customers', 'dated', 'date', 'issue', 'issues',
+}
+
+# generic words that also happen to be enum values ("customer" vs type Customer) are never resolved locally
+AMBIGUOUS = {'customer'}
+
+DATE_PATTERN = re.compile(r'\b\d{4}-\d{2}-\d{2}\b')
+TOKEN_PATTERN = re.compile(r"[\w'/&+-]+")
+
+def is_date(value: str) -> bool:
+    try:
+        date.fromisoformat(value)
+    except ValueError:
+        return False
+    return True
+
+def stem(token: str) -> str:
+    return token[:-1] if len(token) > 3 and token.endswith('s') and not token.endswith('ss') else token
+
+def tokenize(text: str) -> List[str]:
+    return [stem(token) for token in TOKEN_PATTERN.findall(text.casefold())]
+
+STEMMED_STOPWORDS = {stem(word) for word in STOPWORDS}
+
+class LocalFilterParser:
+    """
+    Deterministic query -> FilterParams mapping over the enum values the filter tool already knows
+    (customers, importance levels, types, tags) plus ISO dates. Confidence is the share of meaningful
+    query words that were resolved; anything below 1.0 should go to the LLM.
+    """
+
+    def __init__(self, tools: List[Dict[str, Any]]):
+        properties = tools[0]['function']['parameters']['properties']
+        self.phrases: Dict[Tuple[str, ...], Set[Tuple[str, str]]] = defaultdict(set)
+        for field in ENUM_FIELDS:
+            for value in properties.get(field, {}).get('items', {}).get('enum', []):
+                self._add(tokenize(value), field, value)
+            for value, aliases in ALIASES.get(field, {}).items():
+                for alias in aliases:
+                    self._add(tokenize(alias), field, value)
+        for word in AMBIGUOUS:
+            self._add(tokenize(word), '', word)
+        self.longest = max((len(phrase) for phrase in self.phrases), default=0)
+
+    def _add(self, tokens: List[str], field: str, value: str) -> None:
+        if tokens:
+            self.phrases[tuple(tokens)].add((field, value))
+
+    def parse(self, query: str) -> Tuple[FilterParams, float]:
+        filters: Dict[str, Any] = {}
+        date_matches = DATE_PATTERN.findall(query)
+        if len(set(date_matches)) > 1:
+            return FilterParams(), 0.0
+        # impossible dates such as 2024-13-45 stay unresolved, so the query goes to the LLM
+        dates = [match for match in date_matches if is_date(match)]
+        if dates:
+            filters['date'] = dates[0]
+
+        tokens = tokenize(DATE_PATTERN.sub(' ', query))
+        content = [token for token in tokens if token not in STEMMED_STOPWORDS]
+        resolved = len(dates)
+        values: Dict[str, List[str]] = defaultdict(list)
+
+        i = 0
+        while i < len(tokens):
+            for length in range(min(self.longest, len(tokens) - i), 0, -1):
+                hits = self.phrases.get(tuple(tokens[i:i + length]))
+                if not hits:
+                    continue
+                # a phrase meaning different things in different fields stays unresolved for the LLM
+                if len({field for field, _ in hits}) == 1:
+                    for field, value in hits:
+                        if value not in values[field]:
+                            values[field].append(value)
+                    resolved += sum(token not in STEMMED_STOPWORDS for token in tokens[i:i + length])
+                i += length
+                break
+            else:
+                i += 1
+
+        filters.update(values)
+        if not filters:
+            return FilterParams(), 0.0
+        total = len(content) + len(date_matches)
+        return FilterParams(**filters), min(1.0, resolved / total) if total else 1.0
@@ -1,14 +1,27 @@
 import json
 import asyncio
-from typing import List, Dict, Any, Tuple
+from typing import List, Dict, Any, Optional, Tuple
 from collections import defaultdict
+from datetime import datetime
 import numpy as np
 from clustering.clusters import perform_clustering
+from clustering.incremental import assign_to_centroids, clusters_to_retag, update_centroids
+from db.vectors import load_embeddings, missing_ids, save_embeddings
 import llm
+from llm.embeddings import estimate_tokens
 from schemas import Feedback
 import prompts
 
 importance_map = {"Low": 1, "Medium": 2, "High": 3}
+RETAG_THRESHOLD = 0.2
+TAG_CLUSTER_TOKEN_BUDGET = 3000   # most of one cluster that goes into a prompt
+TAG_REQUEST_TOKEN_BUDGET = 12000  # tickets packed into one tagging request
+TAG_REQUEST_MAX_CLUSTERS = 12
+GOLDEN_RATIO = (5 ** 0.5 - 1) / 2
+
+def parse_date(value: str) -> datetime:
+    # fromisoformat only accepts a trailing Z from Python 3.11
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
 
 def load_json(file_path: str) -> Any:
     with open(file_path, 'r') as f:
@@ -28,33 +41,109 @@ def calculate_customer_impact(feedback_list: List[Dict[str, Any]]) -> int:
     unique_customers = {feedback['customer'] for feedback in feedback_list}
     return len(unique_customers)
 
+def cluster_statistics(data: List[Dict[str, Any]], tagged_clusters: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """
+    importance_score, customer_impact, count and first/last date for every cluster in one pass,
+    joining cluster ids to rows through an id -> row index instead of rescanning data per cluster
+    """
+    rows_by_id = defaultdict(list)
+    for row, item in enumerate(data):
+        rows_by_id[str(item['id'])].append(row)
+
+    keys = list(tagged_clusters)
+    member_cluster, member_row = [], []
+    for code, key in enumerate(keys):
+        rows = {row for feedback_id in tagged_clusters[key]['ids'] for row in rows_by_id.get(str(feedback_id), ())}
+        member_cluster.extend([code] * len(rows))
+        member_row.extend(rows)
+    member_cluster = np.array(member_cluster, dtype=np.int64)
+    member_row = np.array(member_row, dtype=np.int64)
+
+    customer_codes: Dict[str, int] = {}
+    customers = np.array([customer_codes.setdefault(item['customer'], len(customer_codes)) for item in data], dtype=np.int64)
+    importance = np.array([importance_map.get(item['importance'], 1) for item in data], dtype=np.float64)
+    timestamps = np.array([parse_date(item['date']).timestamp() for item in data], dtype=np.float64)
+
+    counts = np.bincount(member_cluster, minlength=len(keys))
+    importance_sums = np.bincount(member_cluster, weights=importance[member_row], minlength=len(keys))
+    pairs = np.unique(member_cluster * max(len(customer_codes), 1) + customers[member_row])
+    impacts = np.bincount(pairs // max(len(customer_codes), 1), minlength=len(keys))
+
+    # members ordered by (cluster, date): each cluster's first and last member bound its date span
+    order = np.lexsort((timestamps[member_row], member_cluster))
+    ends = np.cumsum(counts)
+
+    statistics = {}
+    for code, key in enumerate(keys):
+        count = int(counts[code])
+        statistics[key] = {
+            'count': count,
+            'importance_score': float(importance_sums[code] / count) if count else 0.0,
+            'customer_impact': int(impacts[code]),
+            'first_date': data[member_row[order[ends[code] - count]]]['date'] if count else None,
+            'last_date': data[member_row[order[ends[code] - 1]]]['date'] if count else None,
+        }
+    return statistics
+
 def update_tagged_clusters(data: List[Dict[str, Any]], tagged_clusters: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
-    for cluster_data in tagged_clusters.values():
-        feedback_items = [item for item in data if str(item['id']) in cluster_data['ids']]
-        cluster_data['importance_score'] = calculate_importance_score(feedback_items)
-        cluster_data['customer_impact'] = calculate_customer_impact(feedback_items)
+    for key, stats in cluster_statistics(data, tagged_clusters).items():
+        tagged_clusters[key]['importance_score'] = stats['importance_score']
+        tagged_clusters[key]['customer_impact'] = stats['customer_impact']
     return tagged_clusters
 
-async def get_embeddings(texts: List[str]) -> np.ndarray:
-    tasks = [llm.openai_client_embedding_request(text) for text in texts]
-    embeddings = await asyncio.gather(*tasks)
-    return np.array(embeddings)
+async def get_embeddings(texts: List[str], cache: Optional[llm.EmbeddingCache] = None) -> np.ndarray:
+    return await llm.embed_texts(texts, cache=cache)
 
-async def process_embeddings(feedback_data: List[Feedback]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+async def process_embeddings(feedback_data: List[Feedback], **clustering_options) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
     names = [item.name for item in feedback_data]
     descriptions = [item.description for item in feedback_data]
     
-    name_embeddings, desc_embeddings = await asyncio.gather(
-        get_embeddings(names),
-        get_embeddings(descriptions)
-    )
+    cache = llm.EmbeddingCache()
+    try:
+        name_embeddings, desc_embeddings = await asyncio.gather(
+            get_embeddings(names, cache),
+            get_embeddings(descriptions, cache)
+        )
+    finally:
+        cache.close()
     
-    name_labels, desc_labels = perform_clustering(name_embeddings, desc_embeddings)
+    name_labels, desc_labels = perform_clustering(name_embeddings, desc_embeddings, **clustering_options)
     
     return name_embeddings, desc_embeddings, name_labels, desc_labels
 
+async def store_new_embeddings(data: List[Dict[str, Any]]) -> int:
+    """
+    Append name/description embeddings of feedback missing from the stored embeddings; descriptions
+    embedded for clustering come from the cache. Returns how many items were added.
+    """
+    store = load_embeddings()
+    missing = set(missing_ids(store, [int(item['id']) for item in data]))
+    if not missing:
+        return 0
+    new_items = [item for item in data if int(item['id']) in missing]
+
+    cache = llm.EmbeddingCache()
+    try:
+        name_embeddings, desc_embeddings = await asyncio.gather(
+            get_embeddings([item['name'] for item in new_items], cache),
+            get_embeddings([item['description'] for item in new_items], cache)
+        )
+    finally:
+        cache.close()
+
+    ids = np.array([int(item['id']) for item in new_items], dtype=np.int64)
+    fields = {'name': name_embeddings, 'description': desc_embeddings}
+    if store is not None:
+        ids = np.concatenate([store.ids, ids])
+        fields = {field: np.concatenate([store.indexes[field].matrix, vectors]) for field, vectors in fields.items()}
+    save_embeddings(ids, fields)
+    return len(new_items)
+
+def ticket_text(item: Dict[str, Any]) -> str:
+    return f"Name: {item['name']}\nDescription: {item['description']}"
+
 async def tag_cluster(description_cluster: str, items: List[Dict[str, Any]]) -> Dict[str, Any]:
-    tickets = "\n".join([f"Name: {item['name']}\nDescription: {item['description']}" for item in items])
+    tickets = "\n".join([ticket_text(item) for item in items])
     messages = [
         {"role": "system", "content": prompts.tag_feedback_sys},
         {"role": "user", "content": prompts.tag_feedback_user.format(tickets=tickets)}
@@ -69,9 +158,93 @@ async def tag_cluster(description_cluster: str, items: List[Dict[str, Any]]) ->
         'tags': tags
     }
 
-async def label_clusters(data: List[Dict[str, Any]], cluster_data: Dict[str, Dict[str, str]]) -> Dict[str, Dict[str, Any]]:
+def select_representatives(items: List[Dict[str, Any]], vectors: Optional[np.ndarray] = None,
+                           budget: int = TAG_CLUSTER_TOKEN_BUDGET) -> List[Dict[str, Any]]:
+    """
+    Members that fit the token budget, nearest the cluster centroid first when vectors are given
+    and spread evenly across the cluster otherwise
+    """
+    costs = [estimate_tokens(ticket_text(item)) for item in items]
+    if sum(costs) <= budget:
+        return items
+
+    if vectors is not None:
+        normed = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        centroid = normed.mean(axis=0)
+        order = np.argsort(-(normed @ centroid), kind='stable')
+    else:
+        order = np.argsort([(i * GOLDEN_RATIO) % 1 for i in range(len(items))], kind='stable')
+
+    chosen, used = [], 0
+    for i in order:
+        if used + costs[i] <= budget or not chosen:
+            chosen.append(i)
+            used += costs[i]
+    return [items[i] for i in sorted(chosen)]
+
+def pack_clusters(costs: Dict[str, int], budget: int = TAG_REQUEST_TOKEN_BUDGET,
+                  max_clusters: int = TAG_REQUEST_MAX_CLUSTERS) -> List[List[str]]:
+    """First-fit decreasing packing of clusters into requests under the token and cluster-count limits"""
+    batches: List[List[str]] = []
+    used: List[int] = []
+    for key in sorted(costs, key=lambda key: -costs[key]):
+        for i, batch in enumerate(batches):
+            if len(batch) < max_clusters and used[i] + costs[key] <= budget:
+                batch.append(key)
+                used[i] += costs[key]
+                break
+        else:
+            batches.append([key])
+            used.append(costs[key])
+    return batches
+
+async def tag_cluster_batch(groups: Dict[str, List[Dict[str, Any]]]) -> Dict[str, List[str]]:
+    """Tag several clusters with one request; clusters missing from the reply are tagged on their own"""
+    if len(groups) == 1:
+        [(key, items)] = groups.items()
+        return {key: (await tag_cluster(key, items))['tags']}
+
+    text = "\n\n".join(
+        f"### Group {key}\n" + "\n".join(ticket_text(item) for item in items) for key, items in groups.items()
+    )
+    messages = [
+        {"role": "system", "content": prompts.tag_clusters_sys},
+        {"role": "user", "content": prompts.tag_clusters_user.format(groups=text)}
+    ]
+
+    response = await llm.openai_client_chat_completion_request(messages, model="gpt-4o-2024-08-06")
+    entries = json.loads(response.choices[0].message.content).get('groups', [])
+    tags = {str(entry['group']): entry['tags'] for entry in entries if str(entry.get('group')) in groups and 'tags' in entry}
+
+    missing = [key for key in groups if key not in tags]
+    for result in await asyncio.gather(*(tag_cluster(key, groups[key]) for key in missing)):
+        tags[result['description_cluster']] = result['tags']
+    return tags
+
+async def tag_clusters(clusters: Dict[str, List[Dict[str, Any]]],
+                       vectors: Optional[Dict[str, np.ndarray]] = None) -> Dict[str, List[str]]:
+    """
+    Tag every cluster while keeping prompts within budget: large clusters are cut down to representative
+    members and small ones share a request, so cost follows total tokens rather than cluster count
+    """
+    vectors = vectors or {}
+    samples = {key: select_representatives(items, vectors.get(key)) for key, items in clusters.items()}
+    costs = {key: sum(estimate_tokens(ticket_text(item)) for item in items) for key, items in samples.items()}
+
+    batches = pack_clusters(costs)
+    results = await asyncio.gather(*(tag_cluster_batch({key: samples[key] for key in batch}) for batch in batches))
+
+    tags = {}
+    for result in results:
+        tags.update(result)
+    return tags
+
+async def label_clusters(data: List[Dict[str, Any]], cluster_data: Dict[str, Dict[str, str]],
+                         embeddings: Optional[np.ndarray] = None) -> Dict[str, Dict[str, Any]]:
+    """embeddings (aligned with data) pick the members nearest each centroid when a cluster is too big to send whole"""
     clusters = defaultdict(list)
-    for item in data:
+    rows = defaultdict(list)
+    for row, item in enumerate(data):
         item_id = str(item['id'])
         if item_id in cluster_data:
             description_cluster = cluster_data[item_id]['description_cluster']
@@ -80,9 +253,57 @@ async def label_clusters(data: List[Dict[str, Any]], cluster_data: Dict[str, Dic
                 'name': item['name'],
                 'description': item['description']
             })
+            rows[description_cluster].append(row)
+
+    vectors = {key: embeddings[cluster_rows] for key, cluster_rows in rows.items()} if embeddings is not None else None
+    tags = await tag_clusters(clusters, vectors)
+
+    tagged_clusters = {
+        description_cluster: {'ids': [item['id'] for item in items], 'tags': tags[description_cluster]}
+        for description_cluster, items in clusters.items()
+    }
+    return tagged_clusters
+
+async def cluster_new_feedback(
+    data: List[Dict[str, Any]],
+    tagged_clusters: Dict[str, Dict[str, Any]],
+    centroids: Tuple[List[str], np.ndarray, np.ndarray],
+    retag_threshold: float = RETAG_THRESHOLD
+) -> Tuple[Dict[str, Dict[str, Any]], Tuple[List[str], np.ndarray, np.ndarray], List[str]]:
+    """
+    Assign feedback not yet in any cluster to the nearest description centroid. Only clusters that grew by
+    more than retag_threshold of their size are re-tagged, and only touched clusters get new statistics.
+    Returns the updated clusters, updated centroids and the touched cluster keys.
+    """
+    known_ids = {feedback_id for cluster in tagged_clusters.values() for feedback_id in cluster['ids']}
+    new_items = [item for item in data if str(item['id']) not in known_ids]
+    if not new_items:
+        return tagged_clusters, centroids, []
+
+    keys, centers, counts = centroids
+    cache = llm.EmbeddingCache()
+    try:
+        vectors = await get_embeddings([item['description'] for item in new_items], cache)
+    finally:
+        cache.close()
+    nearest, _ = assign_to_centroids(vectors, centers)
+
+    sizes = {key: len(cluster['ids']) for key, cluster in tagged_clusters.items()}
+    added = defaultdict(int)
+    for item, code in zip(new_items, nearest):
+        cluster = tagged_clusters.setdefault(keys[code], {'ids': [], 'tags': []})
+        cluster['ids'].append(str(item['id']))
+        added[keys[code]] += 1
 
-    tasks = [tag_cluster(description_cluster, items) for description_cluster, items in clusters.items()]
-    tagged_clusters_list = await asyncio.gather(*tasks)
+    items_by_id = {str(item['id']): item for item in data}
+    retag = clusters_to_retag(added, sizes, retag_threshold)
+    retagged = await tag_clusters({
+        key: [items_by_id[feedback_id] for feedback_id in tagged_clusters[key]['ids'] if feedback_id in items_by_id]
+        for key in retag
+    })
+    for key, tags in retagged.items():
+        tagged_clusters[key]['tags'] = tags
 
-    tagged_clusters = {item['description_cluster']: {'ids': item['ids'], 'tags': item['tags']} for item in tagged_clusters_list}
-    return tagged_clusters
\ No newline at end of file
+    update_tagged_clusters(data, {key: tagged_clusters[key] for key in added})
+    centers, counts = update_centroids(centers, counts, nearest, vectors)
+    return tagged_clusters, (keys, centers, counts), sorted(added)
\ No newline at end of file